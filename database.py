@@ -1,11 +1,90 @@
 import os
+import select
+import threading
+import time
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
 from dotenv import load_dotenv, find_dotenv
 load_dotenv(find_dotenv())
+
+# Optional streaming read replica. Credentials and database name default to
+# the primary's.
+DB_REPLICA_HOST = os.getenv("DB_REPLICA_HOST")
+DB_REPLICA_POOL_MIN = int(os.getenv("DB_REPLICA_POOL_MIN", "1"))
+DB_REPLICA_POOL_MAX = int(os.getenv("DB_REPLICA_POOL_MAX", "10"))
+DB_REPLICA_CONNECT_TIMEOUT = int(os.getenv("DB_REPLICA_CONNECT_TIMEOUT", "3"))
+# After the replica fails to connect, reads go straight to the primary for
+# this long before the replica is tried again.
+DB_REPLICA_RETRY_SECONDS = float(os.getenv("DB_REPLICA_RETRY_SECONDS", "30"))
+
+def _connection_params():
+    return dict(user=os.getenv("DB_USER"), password=os.getenv("DB_PASSWORD"), host=os.getenv("DB_HOST"), port=os.getenv("DB_PORT"), database=os.getenv("DB_NAME"))
+
+def _replica_connection_params():
+    params = _connection_params()
+    params.update(
+        host=DB_REPLICA_HOST,
+        port=os.getenv("DB_REPLICA_PORT", params["port"]),
+        user=os.getenv("DB_REPLICA_USER", params["user"]),
+        password=os.getenv("DB_REPLICA_PASSWORD", params["password"]),
+        database=os.getenv("DB_REPLICA_NAME", params["database"]),
+        connect_timeout=DB_REPLICA_CONNECT_TIMEOUT,
+    )
+    return params
+
+def _parse_lsn(lsn: str) -> int:
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+class _WriteTracker:
+    """
+    Highest primary WAL position this process has committed, and the last
+    replay position seen on the replica. A read goes to the replica only once
+    it has replayed this process's latest write.
+    """
+
+    def __init__(self):
+        self.last_write_lsn = 0
+        self.replica_lsn = 0
+        self._lock = threading.Lock()
+
+    def record_write(self, lsn: int):
+        with self._lock:
+            self.last_write_lsn = max(self.last_write_lsn, lsn)
+
+    def record_replay(self, lsn: int):
+        with self._lock:
+            self.replica_lsn = max(self.replica_lsn, lsn)
+
+    def replica_caught_up(self) -> bool:
+        with self._lock:
+            return self.replica_lsn >= self.last_write_lsn
+
+write_tracker = _WriteTracker()
+
+class PrimaryConnection(psycopg2.extensions.connection):
+    """
+    Primary connection that records the WAL position after each commit, so
+    connect_for_read can tell whether the replica has caught up with it.
+    """
+
+    def commit(self):
+        super().commit()
+        if not DB_REPLICA_HOST:
+            return
+        try:
+            with self.cursor() as cursor:
+                cursor.execute("SELECT pg_current_wal_lsn()::text;")
+                write_tracker.record_write(_parse_lsn(cursor.fetchone()[0]))
+            super().rollback()
+        except Exception as e:
+            print(f"Could not record WAL position after commit: {e}")
+
 def connect_to_db():
     try:
         # Connect to your postgres DB
-        connection = psycopg2.connect(user=os.getenv("DB_USER"), password=os.getenv("DB_PASSWORD"), host=os.getenv("DB_HOST"), port=os.getenv("DB_PORT"), database=os.getenv("DB_NAME"))
+        connection = psycopg2.connect(connection_factory=PrimaryConnection, **_connection_params())
         
         print(connection)
         
@@ -17,4 +96,134 @@ def connect_to_db():
     except Exception as e:
         print(f"Error connecting to database: {e}")
         return None
- 
\ No newline at end of file
+
+class _PooledConnection:
+    """
+    Replica connection borrowed from the pool; close() hands it back instead of closing it.
+    """
+
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def close(self):
+        if self._connection is None:
+            return
+        connection, self._connection = self._connection, None
+        broken = bool(connection.closed)
+        if not broken:
+            try:
+                connection.rollback()
+            except Exception:
+                broken = True
+        self._pool.putconn(connection, close=broken)
+
+_replica_pool = None
+_replica_pool_lock = threading.Lock()
+_replica_retry_at = 0.0
+
+def _replica_available() -> bool:
+    return time.monotonic() >= _replica_retry_at
+
+def _mark_replica_down():
+    global _replica_retry_at
+    _replica_retry_at = time.monotonic() + DB_REPLICA_RETRY_SECONDS
+
+def _get_replica_pool():
+    global _replica_pool
+    with _replica_pool_lock:
+        if _replica_pool is None:
+            _replica_pool = psycopg2.pool.ThreadedConnectionPool(
+                DB_REPLICA_POOL_MIN, DB_REPLICA_POOL_MAX, **_replica_connection_params()
+            )
+        return _replica_pool
+
+def connect_for_read():
+    """
+    Connection for read-only queries that can tolerate replication lag, with
+    the same (cursor, connection) shape as connect_to_db.
+
+    Uses the read replica when DB_REPLICA_HOST is set and it has replayed the
+    latest write committed by this process; otherwise, or if the replica is
+    unavailable or its pool is exhausted, falls back to the primary. After a
+    connection failure the replica is skipped for DB_REPLICA_RETRY_SECONDS,
+    so reads do not each wait out the connect timeout. Writes made by other
+    processes are not tracked.
+    """
+    if not DB_REPLICA_HOST or not _replica_available():
+        return connect_to_db()
+    connection = None
+    try:
+        pool = _get_replica_pool()
+        connection = _PooledConnection(pool, pool.getconn())
+        cursor = connection.cursor()
+        if not write_tracker.replica_caught_up():
+            cursor.execute("SELECT pg_last_wal_replay_lsn()::text;")
+            replay_lsn = cursor.fetchone()[0]
+            # NULL means the server is not in recovery, i.e. not actually a replica.
+            write_tracker.record_replay(_parse_lsn(replay_lsn) if replay_lsn else float("inf"))
+            if not write_tracker.replica_caught_up():
+                connection.close()
+                return connect_to_db()
+        return cursor, connection
+    except Exception as e:
+        print(f"Read replica unavailable, using primary: {e}")
+        # An exhausted pool says nothing about the replica's health.
+        if not isinstance(e, psycopg2.pool.PoolError):
+            _mark_replica_down()
+        if connection:
+            connection.close()
+        return connect_to_db()
+
+class NotificationListener(threading.Thread):
+    """
+    Background thread that LISTENs on Postgres channels and dispatches each
+    NOTIFY payload to the handler registered for its channel.
+
+    The connection is re-established after errors; on_reconnect is called
+    each time so callers can drop state that may have missed notifications.
+    """
+
+    def __init__(self, handlers: dict, on_reconnect=None, poll_interval: float = 5.0):
+        super().__init__(name="pg-notification-listener", daemon=True)
+        self.handlers = handlers
+        self.on_reconnect = on_reconnect
+        self.poll_interval = poll_interval
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            connection = None
+            try:
+                connection = psycopg2.connect(**_connection_params())
+                connection.autocommit = True
+                cursor = connection.cursor()
+                for channel in self.handlers:
+                    cursor.execute(f'LISTEN "{channel}";')
+                if self.on_reconnect:
+                    self.on_reconnect()
+
+                while not self._stop_event.is_set():
+                    if select.select([connection], [], [], self.poll_interval) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        handler = self.handlers.get(notify.channel)
+                        if handler:
+                            try:
+                                handler(notify.payload)
+                            except Exception as e:
+                                print(f"Error handling notification on {notify.channel}: {e}")
+            except Exception as e:
+                print(f"Notification listener error, reconnecting: {e}")
+                time.sleep(self.poll_interval)
+            finally:
+                if connection:
+                    connection.close()
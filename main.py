@@ -2,14 +2,21 @@ import io
 import os
 from fastapi import FastAPI, File, Response, UploadFile, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder
+from fastapi.responses import ORJSONResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 import secrets
 from typing import List
 import uvicorn
 from dotenv import load_dotenv, find_dotenv
+from routes.admin import admin_router
 from routes.auth import auth_router
 from routes.manager import manager_router
 from routes.user import user_router
+from service.cache_service import start_reference_listener, stop_reference_listener
+from service.progress_service import start_progress_listener, stop_progress_listener
 
 load_dotenv(find_dotenv())
 
@@ -25,7 +32,8 @@ def verify_credentials(credentials: HTTPBasicCredentials = Depends(security)):
 app = FastAPI(
     title="Image Object & Brand Identifier API",
     description="Accepts an image and returns objects and their brands using Gemini model.",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 
@@ -40,12 +48,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Already-compressed formats: gzip only burns CPU on them and would drop the
+# Content-Length of spooled reports.
+UNCOMPRESSED_MEDIA_TYPES = ("application/pdf", "application/zip", "application/vnd.apache.parquet")
+
+class _MediaTypeGZipResponder(GZipResponder):
+    async def send_with_compression(self, message):
+        await super().send_with_compression(message)
+        if message["type"] == "http.response.start":
+            # Reuse the pass-through starlette applies to text/event-stream.
+            content_type = Headers(raw=message["headers"]).get("content-type", "")
+            if content_type.startswith(UNCOMPRESSED_MEDIA_TYPES):
+                self.content_type_is_excluded = True
+
+class MediaTypeGZipMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware that leaves UNCOMPRESSED_MEDIA_TYPES responses untouched.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or "gzip" not in Headers(scope=scope).get("Accept-Encoding", ""):
+            await super().__call__(scope, receive, send)
+            return
+        await _MediaTypeGZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel)(scope, receive, send)
+
+# Compress responses above the threshold (bytes); large manager payloads
+# dominate bandwidth on mobile clients.
+app.add_middleware(MediaTypeGZipMiddleware, minimum_size=int(os.getenv("GZIP_MINIMUM_SIZE", "1024")), compresslevel=int(os.getenv("GZIP_COMPRESS_LEVEL", "6")))
+
+@app.on_event("startup")
+def start_background_listeners():
+    start_reference_listener()
+    start_progress_listener()
+
+@app.on_event("shutdown")
+def stop_background_listeners():
+    stop_reference_listener()
+    stop_progress_listener()
+
 @app.get("/favicon.ico", include_in_schema=False)
 async def favicon():
     return Response(status_code=204)  # No Content
 app.include_router(auth_router, prefix="/auth", tags=["auth"])
 app.include_router(manager_router, prefix="/manager", tags=["manager"])
 app.include_router(user_router, prefix="/user", tags=["user"])
+app.include_router(admin_router, prefix="/admin", tags=["admin"])
 
 # Optional: run locally
 if __name__ == "__main__":
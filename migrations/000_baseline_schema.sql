@@ -0,0 +1,42 @@
+-- Baseline schema: the tables and columns the application reads and writes,
+-- for fresh development/CI databases. Every statement is a no-op on an
+-- existing database. The login_user and assign_visit functions are managed
+-- outside this repository.
+CREATE TABLE IF NOT EXISTS public.users (
+    user_id     SERIAL PRIMARY KEY,
+    username    TEXT NOT NULL UNIQUE,
+    email       TEXT,
+    full_name   TEXT,
+    user_type   TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS public.stores (
+    store_id    SERIAL PRIMARY KEY,
+    store_name  TEXT NOT NULL,
+    location    TEXT
+);
+
+CREATE TABLE IF NOT EXISTS public.storeassignments (
+    assignment_id       SERIAL PRIMARY KEY,
+    user_id             INTEGER NOT NULL REFERENCES public.users (user_id),
+    store_id            INTEGER NOT NULL REFERENCES public.stores (store_id),
+    assigned_by         INTEGER NOT NULL REFERENCES public.users (user_id),
+    assigned_visit_date DATE NOT NULL,
+    actual_visit_date   TIMESTAMP,
+    status              TEXT NOT NULL DEFAULT 'assigned'
+);
+
+CREATE TABLE IF NOT EXISTS public.storeassignmentimages (
+    image_id         SERIAL PRIMARY KEY,
+    assignment_id    INTEGER NOT NULL REFERENCES public.storeassignments (assignment_id),
+    image_url        TEXT NOT NULL,
+    upload_time      TIMESTAMP NOT NULL DEFAULT now(),
+    status           TEXT NOT NULL DEFAULT 'uploaded',
+    found_sga_photo  TEXT,
+    auditable_photo  TEXT,
+    purity           TEXT,
+    chargeability    TEXT,
+    abused           TEXT,
+    emptyy           TEXT,
+    detected_objects TEXT
+);
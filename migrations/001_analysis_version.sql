@@ -0,0 +1,4 @@
+-- Tag every stored analysis result with the model/prompt/catalog version it
+-- was produced under, so run_analysis can skip images that are up to date.
+ALTER TABLE public.storeassignmentimages
+    ADD COLUMN IF NOT EXISTS analysis_version TEXT;
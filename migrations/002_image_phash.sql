@@ -0,0 +1,5 @@
+-- Perceptual hash (64-bit dHash, hex) per image and the earlier image it
+-- near-duplicates, used to reuse detections and flag photos reused across visits.
+ALTER TABLE public.storeassignmentimages
+    ADD COLUMN IF NOT EXISTS phash TEXT,
+    ADD COLUMN IF NOT EXISTS duplicate_of_image_id BIGINT;
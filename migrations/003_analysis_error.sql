@@ -0,0 +1,3 @@
+-- Reason the last analysis attempt of an image failed (NULL once it succeeds).
+ALTER TABLE public.storeassignmentimages
+    ADD COLUMN IF NOT EXISTS analysis_error TEXT;
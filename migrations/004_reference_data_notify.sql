@@ -0,0 +1,31 @@
+-- NOTIFY 'reference_data_changed' with the table name whenever users or
+-- stores change, so API workers can drop their cached copies.
+CREATE OR REPLACE FUNCTION public.notify_reference_data_changed()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM pg_notify('reference_data_changed', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS users_reference_data_changed ON public.users;
+CREATE TRIGGER users_reference_data_changed
+    AFTER INSERT OR DELETE OR UPDATE OF user_id, username, email, user_type ON public.users
+    FOR EACH STATEMENT EXECUTE FUNCTION public.notify_reference_data_changed();
+
+DROP TRIGGER IF EXISTS stores_reference_data_changed ON public.stores;
+CREATE TRIGGER stores_reference_data_changed
+    AFTER INSERT OR DELETE OR UPDATE OF store_id, store_name ON public.stores
+    FOR EACH STATEMENT EXECUTE FUNCTION public.notify_reference_data_changed();
+
+DROP TRIGGER IF EXISTS users_reference_data_truncated ON public.users;
+CREATE TRIGGER users_reference_data_truncated
+    AFTER TRUNCATE ON public.users
+    FOR EACH STATEMENT EXECUTE FUNCTION public.notify_reference_data_changed();
+
+DROP TRIGGER IF EXISTS stores_reference_data_truncated ON public.stores;
+CREATE TRIGGER stores_reference_data_truncated
+    AFTER TRUNCATE ON public.stores
+    FOR EACH STATEMENT EXECUTE FUNCTION public.notify_reference_data_changed();
@@ -0,0 +1,3 @@
+-- Why the local pre-filter skipped an image (status 'rejected') before detection.
+ALTER TABLE public.storeassignmentimages
+    ADD COLUMN IF NOT EXISTS rejection_reason TEXT;
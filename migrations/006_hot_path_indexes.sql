@@ -0,0 +1,29 @@
+-- migrate: no-transaction
+-- Indexes for the hot read paths. Each is named after the query it serves.
+-- Built CONCURRENTLY so uploads, analysis writes and assignments are not
+-- blocked on existing tables while they build.
+
+-- get_images, get_completed_visits, user get_visits and the report query
+-- (filter on assignment_id, report orders by upload_time).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS storeassignmentimages_assignment_id_upload_time_idx
+    ON public.storeassignmentimages (assignment_id, upload_time);
+
+-- Manager views: get_visits (assigned_by + status = 'assigned') and
+-- get_completed_visits / exports (assigned_by).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS storeassignments_assigned_by_status_idx
+    ON public.storeassignments (assigned_by, status);
+
+-- Employee view: user get_visits.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS storeassignments_user_id_idx
+    ON public.storeassignments (user_id);
+
+-- Store-scoped lookups: the per-store perceptual-hash index and store/date
+-- filtered bulk reports and exports.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS storeassignments_store_id_visit_date_idx
+    ON public.storeassignments (store_id, assigned_visit_date);
+
+-- Perceptual-hash index load: only hashed images, with the hash in the index
+-- so the lookup is index-only.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS storeassignmentimages_phash_idx
+    ON public.storeassignmentimages (assignment_id) INCLUDE (image_id, phash)
+    WHERE phash IS NOT NULL;
@@ -0,0 +1,22 @@
+-- One row per detector call: latency, token usage, retries and prompt-cache
+-- hit/miss, tied to the image it analysed.
+CREATE TABLE IF NOT EXISTS public.model_calls (
+    call_id        BIGSERIAL PRIMARY KEY,
+    image_id       INTEGER REFERENCES public.storeassignmentimages (image_id) ON DELETE CASCADE,
+    assignment_id  INTEGER,
+    backend        TEXT,
+    model_name     TEXT,
+    latency_ms     INTEGER,
+    input_tokens   INTEGER,
+    output_tokens  INTEGER,
+    cached_tokens  INTEGER,
+    retries        INTEGER NOT NULL DEFAULT 0,
+    cache_hit      BOOLEAN,
+    success        BOOLEAN,
+    error          TEXT,
+    created_at     TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS model_calls_image_id_idx ON public.model_calls (image_id);
+CREATE INDEX IF NOT EXISTS model_calls_assignment_id_idx ON public.model_calls (assignment_id);
+CREATE INDEX IF NOT EXISTS model_calls_created_at_idx ON public.model_calls (created_at);
@@ -0,0 +1,16 @@
+-- Per-assignment rollup of the image rows, kept current by
+-- service/summary_service.refresh_assignment_summary in the same transaction
+-- as the image changes. Existing assignments are filled by
+-- scripts/backfill_assignment_summary.py.
+CREATE TABLE IF NOT EXISTS public.storeassignment_summary (
+    assignment_id     INTEGER PRIMARY KEY REFERENCES public.storeassignments (assignment_id) ON DELETE CASCADE,
+    image_count       INTEGER NOT NULL DEFAULT 0,
+    analysed_count    INTEGER NOT NULL DEFAULT 0,
+    pure_count        INTEGER NOT NULL DEFAULT 0,
+    abused_count      INTEGER NOT NULL DEFAULT 0,
+    empty_count       INTEGER NOT NULL DEFAULT 0,
+    avg_chargeability NUMERIC(5, 2),
+    detected_brands   TEXT[] NOT NULL DEFAULT '{}',
+    last_analysed_at  TIMESTAMPTZ,
+    updated_at        TIMESTAMPTZ NOT NULL DEFAULT now()
+);
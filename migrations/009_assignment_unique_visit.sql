@@ -0,0 +1,20 @@
+-- migrate: no-transaction
+-- One assignment per (employee, store, visit date), so concurrent single and
+-- bulk assignments cannot both create the same visit. Built CONCURRENTLY so
+-- assignments are not blocked while it builds.
+
+-- Refuse to build over existing duplicates; resolve them first.
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1
+        FROM public.storeassignments
+        GROUP BY user_id, store_id, assigned_visit_date
+        HAVING count(*) > 1
+    ) THEN
+        RAISE EXCEPTION 'storeassignments has duplicate (user_id, store_id, assigned_visit_date) rows';
+    END IF;
+END $$;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS storeassignments_user_store_visit_date_key
+    ON public.storeassignments (user_id, store_id, assigned_visit_date);
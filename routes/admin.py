@@ -0,0 +1,68 @@
+# apis for on-demand profiling and memory tracing of a running worker
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.security import HTTPBasicCredentials
+from service.auth_service import verify_credentials
+from service.profiling_service import (
+    memory_report,
+    profile_report,
+    start_memory_trace,
+    start_profile,
+    stop_memory_trace,
+    stop_profile,
+)
+
+
+admin_router = APIRouter()
+
+@admin_router.post("/profile/start", summary="Start a time-boxed sampling profile of this worker")
+def start_profiling(duration: float = 30, interval: float = 0.005, _: HTTPBasicCredentials = Depends(verify_credentials)):
+    # Sampling faster than once per millisecond would starve the worker.
+    interval = max(interval, 0.001)
+    try:
+        profiler = start_profile(duration, interval)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "Profiling started", "duration": profiler.duration, "interval": profiler.interval}
+
+@admin_router.get("/profile", summary="Get the current or last profile")
+def get_profile(limit: int = 30, _: HTTPBasicCredentials = Depends(verify_credentials)):
+    try:
+        return profile_report(limit)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@admin_router.post("/profile/stop", summary="Stop profiling and return the top functions")
+def stop_profiling(limit: int = 30, _: HTTPBasicCredentials = Depends(verify_credentials)):
+    try:
+        return stop_profile(limit)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@admin_router.post("/memory/start", summary="Start a time-boxed tracemalloc session")
+def start_memory_tracing(duration: float = 60, frames: int = 10, _: HTTPBasicCredentials = Depends(verify_credentials)):
+    if not 1 <= frames <= 65535:
+        raise HTTPException(status_code=400, detail="frames must be between 1 and 65535.")
+    try:
+        tracer = start_memory_trace(duration, frames)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "Memory tracing started", "duration": tracer.duration, "frames": tracer.frames}
+
+@admin_router.get("/memory", summary="Get allocation growth since tracing started")
+def get_memory_snapshot(limit: int = 30, group_by: str = "lineno", _: HTTPBasicCredentials = Depends(verify_credentials)):
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="group_by must be 'lineno', 'filename' or 'traceback'.")
+    try:
+        return memory_report(limit, group_by)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@admin_router.post("/memory/stop", summary="Stop memory tracing and return the top allocation sites")
+def stop_memory_tracing(limit: int = 30, group_by: str = "lineno", _: HTTPBasicCredentials = Depends(verify_credentials)):
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="group_by must be 'lineno', 'filename' or 'traceback'.")
+    try:
+        return stop_memory_trace(limit, group_by)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
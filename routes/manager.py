@@ -1,57 +1,70 @@
 # apis for get_users, get_stores, assigned_visit
 
-from fastapi import APIRouter, BackgroundTasks, Depends, Response, status, HTTPException
+from fastapi import APIRouter, Depends, Request, Response, status, HTTPException
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBasicCredentials
+import psycopg2.errors
 import psycopg2.extras
 from pydantic import BaseModel
 import logging
-from database import connect_to_db
+from datetime import date
+from typing import List, Optional
+from database import connect_for_read, connect_to_db
+from service.admission_service import AnalysisAdmission, QueueFullError
 from service.analysis_service import run_analysis
+from service.assignment_service import BULK_ASSIGN_MAX_ROWS, assign_visits_bulk
 from service.auth_service import verify_credentials
-from service.report_service import create_pdf_report
+from service.cache_service import cached_response, reference_cache
+from service.export_service import parquet_available, stream_csv, stream_parquet
+from service.progress_service import stream_progress
+from service.report_service import (
+    BULK_REPORT_MAX_ASSIGNMENTS, fetch_assignment_ids, spool_pdf_report, stream_bulk_reports,
+)
+from service.rescore_service import rescore_detections
+from service.usage_service import model_usage
 
 
 
 manager_router = APIRouter()
+analysis_admission = AnalysisAdmission(run_analysis)
+
+def _load_users():
+    conn = None
+    try:
+        cur, conn = connect_to_db()
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+            cursor.execute("SELECT user_id, username, email FROM users WHERE user_type = 'employee';")
+            return cursor.fetchall()
+    finally:
+        if conn:
+            conn.close()
+
+def _load_stores():
+    conn = None
+    try:
+        cur, conn = connect_to_db()
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+            cursor.execute("SELECT store_id, store_name FROM stores;")
+            return cursor.fetchall()
+    finally:
+        if conn:
+            conn.close()
 
 @manager_router.get("/get_users", summary="Get all users")
-async def get_users(_: HTTPBasicCredentials = Depends(verify_credentials)):
+def get_users(request: Request, _: HTTPBasicCredentials = Depends(verify_credentials)):
     try:
-        cursor, connection = connect_to_db()
-        if cursor is None:
-            raise HTTPException(status_code=500, detail="Database connection failed")
-        
-        cursor.execute("SELECT user_id, username, email FROM users WHERE user_type = 'employee';")
-        users = cursor.fetchall()
-        column_names = [desc[0] for desc in cursor.description]
-        users_dict = [dict(zip(column_names, row)) for row in users]
-        print(f"Fetched users: {users_dict}")
-        # print(f"Fetched users: {users}")
-        return {"status": "success", "data": users_dict}
+        users, etag = reference_cache.get("users", _load_users)
+        return cached_response(request, {"status": "success", "data": users}, etag)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching users: {e}")
-    finally:
-        if cursor:
-            cursor.close()
 
 @manager_router.get("/get_stores", summary="Get all stores")
-async def get_stores(_: HTTPBasicCredentials = Depends(verify_credentials)):
+def get_stores(request: Request, _: HTTPBasicCredentials = Depends(verify_credentials)):
     try:
-        cursor, conn = connect_to_db()
-        if cursor is None:
-            raise HTTPException(status_code=500, detail="Database connection failed")
-        
-        cursor.execute("SELECT store_id, store_name FROM stores;")
-        stores = cursor.fetchall()
-        column_names = [desc[0] for desc in cursor.description]
-        stores_dict = [dict(zip(column_names, row)) for row in stores]
-        print(f"Fetched stores: {stores_dict}")
-        return {"status": "success", "data": stores_dict}
+        stores, etag = reference_cache.get("stores", _load_stores)
+        return cached_response(request, {"status": "success", "data": stores}, etag)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching stores: {e}")
-    finally:
-        if cursor:
-            cursor.close()
 
 # Request body schema
 class AssignVisitRequest(BaseModel):
@@ -75,6 +88,8 @@ def assign_visit(request: AssignVisitRequest, _: HTTPBasicCredentials = Depends(
 
             return {"assignment_id": row["assign_visit"] if row else None}
 
+    except psycopg2.errors.UniqueViolation:
+        raise HTTPException(status_code=409, detail="This visit is already assigned.")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -82,26 +97,53 @@ def assign_visit(request: AssignVisitRequest, _: HTTPBasicCredentials = Depends(
         if conn:
             conn.close()
 
+class BulkVisit(BaseModel):
+    user_id: int
+    store_id: int
+    visit_date: str  # ISO format (YYYY-MM-DD)
+
+class AssignVisitsBulkRequest(BaseModel):
+    manager_id: int
+    visits: List[BulkVisit]
+
+@manager_router.post("/assign_visits_bulk", summary="Assign many visits in one request")
+def assign_visits_bulk_endpoint(request: AssignVisitsBulkRequest, _: HTTPBasicCredentials = Depends(verify_credentials)):
+    # Rows are validated together and the valid ones inserted in one statement;
+    # results come back in request order with an assignment_id or an error each.
+    if len(request.visits) > BULK_ASSIGN_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_ASSIGN_MAX_ROWS} visits per request.")
+    try:
+        results = assign_visits_bulk(request.manager_id, [visit.model_dump() for visit in request.visits])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    created = sum(1 for result in results if "assignment_id" in result)
+    return {"created": created, "failed": len(results) - created, "results": results}
+
+GET_VISITS_QUERY = """
+    SELECT 
+        sa.assignment_id,
+        sa.user_id,
+        u.username,
+        s.store_name,
+        sa.assigned_visit_date
+    FROM public.storeassignments sa
+    JOIN public.users u ON sa.user_id = u.user_id
+    JOIN public.stores s ON sa.store_id = s.store_id
+    WHERE sa.status = 'assigned'
+      AND sa.assigned_by = %s
+"""
+
 @manager_router.get("/get_visits", summary="Get all assigned visits")
 def get_visits(manager_id: int, _: HTTPBasicCredentials = Depends(verify_credentials)):
     conn = None
     try:
-        cur, conn = connect_to_db()
+        cur, conn = connect_for_read()
         with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
             cursor.execute(
-                """
-                SELECT 
-                    sa.assignment_id,
-                    sa.user_id,
-                    u.username,
-                    s.store_name,
-                    sa.assigned_visit_date
-                FROM public.storeassignments sa
-                JOIN public.users u ON sa.user_id = u.user_id
-                JOIN public.stores s ON sa.store_id = s.store_id
-                WHERE sa.status = 'assigned'
-                  AND sa.assigned_by = %s
-                """,
+                GET_VISITS_QUERY,
                 (manager_id,)
             )
             rows = cursor.fetchall()
@@ -115,49 +157,96 @@ def get_visits(manager_id: int, _: HTTPBasicCredentials = Depends(verify_credent
         if conn:
             conn.close()
 
+GET_COMPLETED_VISITS_QUERY = """
+    SELECT json_build_object('visits', COALESCE(json_agg(v), '[]'::json))::text
+    FROM (
+        SELECT 
+            sa.assignment_id,
+            s.store_name,
+            u.username AS employee_name,
+            sa.assigned_visit_date,
+            sa.actual_visit_date,
+            sa.status, -- assignment status (not per image)
+            json_agg(
+                json_build_object(
+                    'image_id', sai.image_id,
+                    'image_url', sai.image_url,
+                    'status', sai.status,
+                    'found_sga_photo', sai.found_sga_photo,
+                    'auditable_photo', sai.auditable_photo,
+                    'purity', sai.purity,
+                    'chargeability', sai.chargeability,
+                    'abused', sai.abused,
+                    'emptyy', sai.emptyy,
+                    'detected_objects', sai.detected_objects
+                )
+            ) AS images
+        FROM public.storeassignmentimages sai
+        JOIN public.storeassignments sa ON sai.assignment_id = sa.assignment_id
+        JOIN public.users u ON sa.user_id = u.user_id
+        JOIN public.stores s ON sa.store_id = s.store_id
+        WHERE sa.assigned_by = %s
+        GROUP BY sa.assignment_id, s.store_name, u.username, 
+                sa.assigned_visit_date, sa.actual_visit_date, sa.status
+    ) v;
+"""
+
 @manager_router.get("/get_completed_visits", summary="Get all completed visits")
 def get_visit_images(manager_id: int, _: HTTPBasicCredentials = Depends(verify_credentials)):
     conn = None
     try:
-        cur, conn = connect_to_db()
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+        cur, conn = connect_for_read()
+        with conn.cursor() as cursor:
+            # Postgres builds the whole response body; it is cast to text so
+            # psycopg2 does not parse it and FastAPI does not re-encode it.
             cursor.execute(
-                """
-                SELECT 
-                    sa.assignment_id,
-                    s.store_name,
-                    u.username AS employee_name,
-                    sa.assigned_visit_date,
-                    sa.actual_visit_date,
-                    sa.status, -- assignment status (not per image)
-                    json_agg(
-                        json_build_object(
-                            'image_id', sai.image_id,
-                            'image_url', sai.image_url,
-                            'status', sai.status,
-                            'found_sga_photo', sai.found_sga_photo,
-                            'auditable_photo', sai.auditable_photo,
-                            'purity', sai.purity,
-                            'chargeability', sai.chargeability,
-                            'abused', sai.abused,
-                            'emptyy', sai.emptyy,
-                            'detected_objects', sai.detected_objects
-                        )
-                    ) AS images
-                FROM public.storeassignmentimages sai
-                JOIN public.storeassignments sa ON sai.assignment_id = sa.assignment_id
-                JOIN public.users u ON sa.user_id = u.user_id
-                JOIN public.stores s ON sa.store_id = s.store_id
-                WHERE sa.assigned_by = %s
-                GROUP BY sa.assignment_id, s.store_name, u.username, 
-                        sa.assigned_visit_date, sa.actual_visit_date, sa.status;
-
-                """,
+                GET_COMPLETED_VISITS_QUERY,
                 (manager_id,)
             )
-            rows = cursor.fetchall()
+            body = cursor.fetchone()[0]
 
-            return {"visits": rows}
+            return Response(content=body, media_type="application/json")
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    finally:
+        if conn:
+            conn.close()
+
+GET_VISIT_SUMMARIES_QUERY = """
+    SELECT
+        sa.assignment_id,
+        s.store_name,
+        u.username AS employee_name,
+        sa.assigned_visit_date,
+        sa.actual_visit_date,
+        sa.status,
+        COALESCE(sas.image_count, 0) AS image_count,
+        COALESCE(sas.analysed_count, 0) AS analysed_count,
+        COALESCE(sas.pure_count, 0) AS pure_count,
+        COALESCE(sas.abused_count, 0) AS abused_count,
+        COALESCE(sas.empty_count, 0) AS empty_count,
+        sas.avg_chargeability,
+        COALESCE(sas.detected_brands, '{}') AS detected_brands,
+        sas.last_analysed_at
+    FROM public.storeassignments sa
+    JOIN public.users u ON sa.user_id = u.user_id
+    JOIN public.stores s ON sa.store_id = s.store_id
+    LEFT JOIN public.storeassignment_summary sas ON sa.assignment_id = sas.assignment_id
+    WHERE sa.assigned_by = %s
+    ORDER BY sa.assigned_visit_date DESC, sa.assignment_id DESC
+"""
+
+@manager_router.get("/get_visit_summaries", summary="Get one summary row per visit")
+def get_visit_summaries(manager_id: int, _: HTTPBasicCredentials = Depends(verify_credentials)):
+    # Reads the per-assignment rollup instead of aggregating every image row.
+    conn = None
+    try:
+        cur, conn = connect_for_read()
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+            cursor.execute(GET_VISIT_SUMMARIES_QUERY, (manager_id,))
+            return {"visits": cursor.fetchall()}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -203,21 +292,147 @@ def get_visit_images(manager_id: int, _: HTTPBasicCredentials = Depends(verify_c
 #     return {"status": "Analysis started", "assignment_id": assignment_id, "result": result}
 
 @manager_router.post("/analyse_visit", summary="Analyse completed visit")
-async def analyse_visit(assignment_id: int, background_tasks: BackgroundTasks):
-    # immediately schedule the job
-    background_tasks.add_task(run_analysis, assignment_id)
+async def analyse_visit(assignment_id: int, force: bool = False):
+    # immediately schedule the job; only new, failed or stale images are
+    # re-analysed unless force=True. A repeat call for an assignment that is
+    # already queued or running joins that run; with force=True a forced
+    # re-run is queued to start once it finishes.
+    try:
+        _, joined, followup = analysis_admission.submit(assignment_id, force)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
 
     # manager doesn’t wait for analysis to finish
-    return {"status": "Analysis started", "assignment_id": assignment_id}
+    if followup:
+        message = "Analysis already running; forced re-run queued"
+    elif joined:
+        message = "Analysis already running"
+    else:
+        message = "Analysis started"
+    return {"status": message, "assignment_id": assignment_id, "force": force}
+
+@manager_router.get("/analysis_events", summary="Stream analysis progress as Server-Sent Events")
+async def analysis_events(
+    request: Request,
+    manager_id: Optional[int] = None,
+    assignment_id: Optional[int] = None,
+    _: HTTPBasicCredentials = Depends(verify_credentials)
+):
+    # Pushes started / image_done / completed / failed events as run_analysis
+    # progresses, so clients no longer poll get_completed_visits.
+    if manager_id is None and assignment_id is None:
+        raise HTTPException(status_code=400, detail="Provide a manager_id or an assignment_id.")
+    return StreamingResponse(
+        stream_progress(request, manager_id, assignment_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @manager_router.get("/report", summary="Generate PDF Report for a Visit")
 async def generate_report(assignment_id: int):
-    pdf_bytes = await create_pdf_report(assignment_id)
-    if not pdf_bytes:
+    # Images go through temp files and the PDF is spooled, so memory stays
+    # bounded for large reports. The PDF is complete before the first byte is
+    # sent; it is then sent in chunks with its length.
+    report = await spool_pdf_report(assignment_id)
+    if report is None:
         raise HTTPException(status_code=404, detail="No data found for this assignment.")
-    
-    return Response(
-        content=pdf_bytes,
+    chunks, length = report
+    return StreamingResponse(
+        chunks,
         media_type="application/pdf",
-        headers={"Content-Disposition": f"inline; filename=report_{assignment_id}.pdf"}
+        headers={
+            "Content-Disposition": f"inline; filename=report_{assignment_id}.pdf",
+            "Content-Length": str(length)
+        }
     )
+
+@manager_router.get("/reports/bulk", summary="Export PDF reports for many visits as a ZIP")
+def generate_bulk_reports(
+    manager_id: Optional[int] = None,
+    store_id: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    _: HTTPBasicCredentials = Depends(verify_credentials)
+):
+    if manager_id is None and store_id is None:
+        raise HTTPException(status_code=400, detail="Provide at least a manager_id or a store_id.")
+    try:
+        assignment_ids = fetch_assignment_ids(manager_id, store_id, date_from, date_to)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if not assignment_ids:
+        raise HTTPException(status_code=404, detail="No assignments match this filter.")
+    if len(assignment_ids) > BULK_REPORT_MAX_ASSIGNMENTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{len(assignment_ids)} assignments match; narrow the filter to at most {BULK_REPORT_MAX_ASSIGNMENTS}."
+        )
+
+    return StreamingResponse(
+        stream_bulk_reports(assignment_ids),
+        media_type="application/zip",
+        headers={"Content-Disposition": "attachment; filename=reports.zip"}
+    )
+
+@manager_router.get("/export", summary="Export analysis results as CSV or Parquet")
+def export_results(
+    format: str = "csv",
+    manager_id: Optional[int] = None,
+    store_id: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    _: HTTPBasicCredentials = Depends(verify_credentials)
+):
+    filters = {"manager_id": manager_id, "store_id": store_id, "date_from": date_from, "date_to": date_to}
+    if format == "csv":
+        return StreamingResponse(
+            stream_csv(filters),
+            media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=analysis_export.csv"}
+        )
+    if format == "parquet":
+        if not parquet_available():
+            raise HTTPException(status_code=501, detail="Parquet export requires pyarrow to be installed.")
+        return StreamingResponse(
+            stream_parquet(filters),
+            media_type="application/vnd.apache.parquet",
+            headers={"Content-Disposition": "attachment; filename=analysis_export.parquet"}
+        )
+    raise HTTPException(status_code=400, detail="format must be 'csv' or 'parquet'.")
+
+@manager_router.get("/model_usage", summary="Model latency and token usage per assignment, manager or day")
+def get_model_usage(
+    group_by: str = "day",
+    manager_id: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    _: HTTPBasicCredentials = Depends(verify_credentials)
+):
+    try:
+        rows = model_usage(group_by, manager_id, date_from, date_to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"group_by": group_by, "usage": rows}
+
+@manager_router.post("/rescore", summary="Re-apply scoring rules to stored detections")
+def rescore(
+    dry_run: bool = True,
+    assignment_id: Optional[int] = None,
+    _: HTTPBasicCredentials = Depends(verify_credentials)
+):
+    # Recomputes purity/abused/empty from detected_objects after a catalog or
+    # rules change, without calling the detector. dry_run only reports the diff.
+    # Writes are limited to one assignment per request; full-history runs
+    # belong in scripts/rescore.py --apply.
+    if not dry_run and assignment_id is None:
+        raise HTTPException(
+            status_code=400,
+            detail="dry_run=false needs an assignment_id; run scripts/rescore.py --apply to rescore everything."
+        )
+    try:
+        return rescore_detections(dry_run=dry_run, assignment_id=assignment_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,54 +1,63 @@
 import os
+import re
 from fastapi import APIRouter, File, UploadFile, Form, Depends, HTTPException
-from typing import List
-from azure.storage.blob import BlobServiceClient
+from typing import List, Optional
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.blob import BlobSasPermissions, BlobServiceClient, generate_blob_sas
 import uuid
 from fastapi.security import HTTPBasicCredentials
 import psycopg2.extras
 from pydantic import BaseModel
-from datetime import datetime
-from database import connect_to_db
+from datetime import datetime, timedelta
+from database import connect_for_read, connect_to_db
 from service.auth_service import verify_credentials
+from service.summary_service import refresh_assignment_summary
 
 
 BLOB_CONTAINER_NAME = os.getenv("BLOB_CONTAINER_NAME")
 BLOB_CONNECTION_STRING = os.getenv("BLOB_CONNECTION_STRING")
+# Lifetime of the per-file upload URLs handed out by /visit-upload/init.
+UPLOAD_URL_TTL_MINUTES = int(os.getenv("UPLOAD_URL_TTL_MINUTES", "30"))
+# Suggested block size for chunked uploads (Put Block / Put Block List).
+UPLOAD_BLOCK_SIZE = int(os.getenv("UPLOAD_BLOCK_SIZE", str(4 * 1024 * 1024)))
 user_router = APIRouter()
 
+GET_USER_VISITS_QUERY = """
+    SELECT 
+        sa.assignment_id,
+        s.store_name,
+        sa.assigned_visit_date,
+        sa.actual_visit_date,
+        m.username AS assigned_by,
+        sa.status,
+        COALESCE(
+            json_agg(
+                json_build_object(
+                    'image_id', sai.image_id,
+                    'image_url', sai.image_url,
+                    'status', sai.status
+                )
+            ) FILTER (WHERE sai.image_id IS NOT NULL), '[]'
+        ) AS images
+    FROM public.storeassignments sa
+    JOIN public.stores s 
+        ON sa.store_id = s.store_id
+    JOIN public.users m 
+        ON sa.assigned_by = m.user_id
+    LEFT JOIN public.storeassignmentimages sai
+        ON sa.assignment_id = sai.assignment_id
+    WHERE sa.user_id = %s
+    GROUP BY sa.assignment_id, s.store_name, sa.assigned_visit_date, m.username, sa.status;
+"""
+
 @user_router.get("/get_visits", summary="Get visits for the user")
 def get_user_visits(user_id: int, _: HTTPBasicCredentials = Depends(verify_credentials)):
     conn = None
     try:
-        cur, conn = connect_to_db()
+        cur, conn = connect_for_read()
         with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
             cursor.execute(
-                """
-                SELECT 
-                    sa.assignment_id,
-                    s.store_name,
-                    sa.assigned_visit_date,
-                    sa.actual_visit_date,
-                    m.username AS assigned_by,
-                    sa.status,
-                    COALESCE(
-                        json_agg(
-                            json_build_object(
-                                'image_id', sai.image_id,
-                                'image_url', sai.image_url,
-                                'status', sai.status
-                            )
-                        ) FILTER (WHERE sai.image_id IS NOT NULL), '[]'
-                    ) AS images
-                FROM public.storeassignments sa
-                JOIN public.stores s 
-                    ON sa.store_id = s.store_id
-                JOIN public.users m 
-                    ON sa.assigned_by = m.user_id
-                LEFT JOIN public.storeassignmentimages sai
-                    ON sa.assignment_id = sai.assignment_id
-                WHERE sa.user_id = %s
-                GROUP BY sa.assignment_id, s.store_name, sa.assigned_visit_date, m.username, sa.status;
-                """,
+                GET_USER_VISITS_QUERY,
                 (user_id,)
             )
             rows = cursor.fetchall()
@@ -113,6 +122,7 @@ def upload_visit_images(
                     """,
                     (assignment_id, url)
                 )
+            refresh_assignment_summary(cursor, assignment_id)
 
             conn.commit()
 
@@ -127,4 +137,157 @@ def upload_visit_images(
 
     finally:
         if conn:
-            conn.close()
\ No newline at end of file
+            conn.close()
+# -------------------------------
+# Direct-to-blob uploads
+# -------------------------------
+class UploadFileSpec(BaseModel):
+    filename: str
+    content_type: Optional[str] = None
+
+class UploadInitRequest(BaseModel):
+    assignment_id: int
+    files: List[UploadFileSpec]
+
+class UploadCompleteRequest(BaseModel):
+    assignment_id: int
+    blob_names: List[str]
+
+def _safe_filename(filename: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]", "_", os.path.basename(filename)) or "image"
+
+@user_router.post("/visit-upload/init", summary="Get direct upload URLs for visit images")
+def init_visit_upload(request: UploadInitRequest, _: HTTPBasicCredentials = Depends(verify_credentials)):
+    """
+    Issue one short-lived SAS URL per file so the client uploads straight to
+    the blob container instead of through the API.
+
+    The client uploads each file in blocks (Put Block, then Put Block List) and
+    can resume an interrupted upload by listing the blob's uncommitted blocks.
+    It then calls /visit-upload/complete with the blob names. Works the same
+    against the Azurite emulator (BLOB_CONNECTION_STRING=UseDevelopmentStorage=true).
+    """
+    if not request.files:
+        raise HTTPException(status_code=400, detail="No files to upload.")
+    try:
+        blob_service_client = BlobServiceClient.from_connection_string(BLOB_CONNECTION_STRING)
+        container_client = blob_service_client.get_container_client(BLOB_CONTAINER_NAME)
+        credential = blob_service_client.credential
+        if not getattr(credential, "account_key", None):
+            raise HTTPException(
+                status_code=400,
+                detail="Direct uploads are unavailable: BLOB_CONNECTION_STRING has no account key to sign upload URLs. Use /user/visit-upload instead."
+            )
+        expires_at = datetime.utcnow() + timedelta(minutes=UPLOAD_URL_TTL_MINUTES)
+
+        uploads = []
+        for file in request.files:
+            blob_name = f"{request.assignment_id}/{uuid.uuid4()}_{_safe_filename(file.filename)}"
+            blob_client = container_client.get_blob_client(blob_name)
+            sas_token = generate_blob_sas(
+                account_name=credential.account_name,
+                container_name=BLOB_CONTAINER_NAME,
+                blob_name=blob_name,
+                account_key=credential.account_key,
+                permission=BlobSasPermissions(read=True, create=True, write=True),
+                expiry=expires_at,
+                content_type=file.content_type,
+            )
+            uploads.append({
+                "filename": file.filename,
+                "blob_name": blob_name,
+                "upload_url": f"{blob_client.url}?{sas_token}",
+            })
+
+        return {
+            "assignment_id": request.assignment_id,
+            "expires_at": expires_at.isoformat() + "Z",
+            "block_size": UPLOAD_BLOCK_SIZE,
+            "uploads": uploads,
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@user_router.post("/visit-upload/complete", summary="Register directly uploaded visit images")
+def complete_visit_upload(request: UploadCompleteRequest, _: HTTPBasicCredentials = Depends(verify_credentials)):
+    """
+    Confirm the blobs exist, then insert all image rows in one statement and,
+    if any were new, mark the visit as done. Blob names already registered are
+    skipped, so the call is safe to retry; the first visit date is kept and a
+    visit already past 'visited' keeps its status.
+    """
+    prefix = f"{request.assignment_id}/"
+    invalid = [name for name in request.blob_names if not name.startswith(prefix)]
+    if invalid or not request.blob_names:
+        raise HTTPException(status_code=400, detail=f"Blob names must be non-empty and start with '{prefix}': {invalid}")
+
+    conn = None
+    try:
+        blob_service_client = BlobServiceClient.from_connection_string(BLOB_CONNECTION_STRING)
+        container_client = blob_service_client.get_container_client(BLOB_CONTAINER_NAME)
+
+        uploaded_urls = []
+        missing = []
+        for blob_name in dict.fromkeys(request.blob_names):
+            blob_client = container_client.get_blob_client(blob_name)
+            try:
+                blob_client.get_blob_properties()
+            except ResourceNotFoundError:
+                missing.append(blob_name)
+                continue
+            uploaded_urls.append(blob_client.url)
+
+        if not uploaded_urls:
+            raise HTTPException(status_code=400, detail=f"None of the blobs were uploaded: {missing}")
+
+        cur, conn = connect_to_db()
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+            inserted = psycopg2.extras.execute_values(
+                cursor,
+                """
+                INSERT INTO public.storeassignmentimages (assignment_id, image_url, status)
+                SELECT v.assignment_id, v.image_url, 'uploaded'
+                FROM (VALUES %s) AS v (assignment_id, image_url)
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM public.storeassignmentimages sai
+                    WHERE sai.assignment_id = v.assignment_id
+                      AND sai.image_url = v.image_url
+                )
+                RETURNING image_id, image_url
+                """,
+                [(request.assignment_id, url) for url in uploaded_urls],
+                fetch=True,
+            )
+            if inserted:
+                cursor.execute(
+                    """
+                    UPDATE public.storeassignments
+                    SET status = 'visited',
+                        actual_visit_date = COALESCE(actual_visit_date, %s)
+                    WHERE assignment_id = %s
+                      AND status IN ('assigned', 'visited')
+                    """,
+                    (datetime.utcnow(), request.assignment_id)
+                )
+                refresh_assignment_summary(cursor, request.assignment_id)
+            conn.commit()
+
+        return {
+            "assignment_id": request.assignment_id,
+            "uploaded_images": uploaded_urls,
+            "inserted_images": inserted,
+            "missing_blobs": missing,
+            "message": f"{len(inserted)} images saved successfully."
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    finally:
+        if conn:
+            conn.close()
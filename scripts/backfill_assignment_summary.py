@@ -0,0 +1,37 @@
+"""
+Fill public.storeassignment_summary for assignments analysed before it existed
+(migrations/008_assignment_summary.sql). Safe to re-run; every row is recomputed.
+
+Usage:
+    python scripts/backfill_assignment_summary.py [--batch-size 500]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import connect_to_db
+from service.summary_service import refresh_assignment_summaries
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500, help="assignments refreshed per transaction")
+    args = parser.parse_args()
+
+    _, connection = connect_to_db()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT assignment_id FROM public.storeassignments ORDER BY assignment_id")
+            assignment_ids = [row[0] for row in cursor.fetchall()]
+
+        for start in range(0, len(assignment_ids), args.batch_size):
+            batch = assignment_ids[start:start + args.batch_size]
+            with connection.cursor() as cursor:
+                refresh_assignment_summaries(cursor, batch)
+            connection.commit()
+            print(f"Refreshed {start + len(batch)}/{len(assignment_ids)} assignment summaries")
+    finally:
+        connection.close()
+
+if __name__ == "__main__":
+    main()
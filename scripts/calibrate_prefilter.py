@@ -0,0 +1,106 @@
+"""
+Calibrate the pre-filter thresholds in service/prefilter_service.py.
+
+Computes blur, brightness and edge-density metrics for a folder of photos that
+should pass (e.g. a sample of good audit photos) and, optionally, a folder of
+photos that should be rejected, then prints metric percentiles and suggested
+PREFILTER_* environment values.
+
+Usage:
+    python scripts/calibrate_prefilter.py path/to/good_photos [--reject path/to/bad_photos] [--keep 0.98]
+"""
+import argparse
+import os
+import sys
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from service.prefilter_service import image_metrics
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+def collect_metrics(folder: str) -> dict:
+    metrics = {"blur": [], "brightness": [], "edge_density": []}
+    for root, _, files in os.walk(folder):
+        for name in sorted(files):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            try:
+                with Image.open(path) as img:
+                    values = image_metrics(img)
+            except Exception as e:
+                print(f"Skipping {path}: {e}")
+                continue
+            for key, value in values.items():
+                metrics[key].append(value)
+    return {key: np.array(values) for key, values in metrics.items()}
+
+def print_percentiles(title: str, metrics: dict):
+    print(f"\n{title} ({len(metrics['blur'])} images)")
+    for key, values in metrics.items():
+        if len(values) == 0:
+            continue
+        p = np.percentile(values, [1, 5, 25, 50, 75, 95, 99])
+        print(f"  {key:<13} " + "  ".join(f"{v:10.3f}" for v in p) + "   (p1 p5 p25 p50 p75 p95 p99)")
+
+def thresholds(metrics: dict, tail: float) -> dict:
+    # Lower bounds at the tail percentile; brightness split across both ends.
+    return {
+        "PREFILTER_BLUR_THRESHOLD": np.percentile(metrics["blur"], tail),
+        "PREFILTER_DARK_THRESHOLD": np.percentile(metrics["brightness"], tail / 2),
+        "PREFILTER_BRIGHT_THRESHOLD": np.percentile(metrics["brightness"], 100 - tail / 2),
+        "PREFILTER_MIN_EDGE_DENSITY": np.percentile(metrics["edge_density"], tail),
+    }
+
+def pass_rate(metrics: dict, suggested: dict) -> float:
+    """
+    Fraction of photos that pass every cut, matching prefilter_image.
+    """
+    passed = (
+        (metrics["blur"] >= suggested["PREFILTER_BLUR_THRESHOLD"])
+        & (metrics["brightness"] >= suggested["PREFILTER_DARK_THRESHOLD"])
+        & (metrics["brightness"] <= suggested["PREFILTER_BRIGHT_THRESHOLD"])
+        & (metrics["edge_density"] >= suggested["PREFILTER_MIN_EDGE_DENSITY"])
+    )
+    return float(passed.mean())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("good", help="Folder of photos that should pass the pre-filter.")
+    parser.add_argument("--reject", help="Folder of photos that should be rejected.")
+    parser.add_argument("--keep", type=float, default=0.98, help="Fraction of good photos that must pass (default 0.98).")
+    args = parser.parse_args()
+
+    good = collect_metrics(args.good)
+    if len(good["blur"]) == 0:
+        sys.exit(f"No images found in {args.good}")
+    print_percentiles("Good photos", good)
+
+    # A photo must pass all four cuts, so cutting each at the (1 - keep)
+    # quantile would pass fewer than `keep` of the good set. Instead find the
+    # largest per-cut tail whose cuts together still pass `keep` of it.
+    low, high = 0.0, (1 - args.keep) * 100
+    for _ in range(30):
+        tail = (low + high) / 2
+        if pass_rate(good, thresholds(good, tail)) >= args.keep:
+            low = tail
+        else:
+            high = tail
+    suggested = thresholds(good, low)
+    print(f"\nSuggested thresholds pass {pass_rate(good, suggested):.1%} of the good photos (target {args.keep:.1%}).")
+
+    if args.reject:
+        bad = collect_metrics(args.reject)
+        print_percentiles("Photos to reject", bad)
+        if len(bad["blur"]):
+            print(f"Suggested thresholds reject {1 - pass_rate(bad, suggested):.1%} of the photos to reject.")
+
+    print("\nSuggested settings:")
+    for key, value in suggested.items():
+        print(f"{key}={value:.4g}")
+    print("Run with PREFILTER_MODE=shadow first and check the logged rejections before PREFILTER_MODE=enforce.")
+
+if __name__ == "__main__":
+    main()
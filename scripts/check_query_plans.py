@@ -0,0 +1,182 @@
+"""
+Fail if a hot query's plan sequentially scans a large table.
+
+Runs EXPLAIN for the queries behind routes/*, the report, export and usage
+services and the analysis lookups, and reports every Seq Scan on LARGE_TABLES. Run it against a database with
+realistic volume; --seed fills a disposable database with synthetic rows first.
+Never use --seed against production.
+
+Usage:
+    python scripts/migrate.py && python scripts/check_query_plans.py --seed
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DETECTOR_BACKEND", "fake")
+from database import connect_to_db
+from routes.manager import GET_COMPLETED_VISITS_QUERY, GET_VISIT_SUMMARIES_QUERY, GET_VISITS_QUERY
+from routes.user import GET_USER_VISITS_QUERY
+from service.analysis_service import GET_IMAGES_QUERY, STORE_HASHES_QUERY
+from service.export_service import EXPORT_QUERY
+from service.report_service import ASSIGNMENT_IDS_QUERY, FETCH_ASSIGNMENT_QUERY, FETCH_ASSIGNMENTS_QUERY
+from service.usage_service import MODEL_USAGE_QUERY, USAGE_GROUPS
+
+LARGE_TABLES = {"storeassignments", "storeassignmentimages", "model_calls"}
+
+SEED_SQL = """
+INSERT INTO public.users (username, email, full_name, user_type)
+SELECT 'seed_manager_' || g, 'seed_manager_' || g || '@example.com', 'Seed Manager ' || g, 'manager'
+FROM generate_series(1, %(managers)s) g;
+
+INSERT INTO public.users (username, email, full_name, user_type)
+SELECT 'seed_employee_' || g, 'seed_employee_' || g || '@example.com', 'Seed Employee ' || g, 'employee'
+FROM generate_series(1, %(employees)s) g;
+
+INSERT INTO public.stores (store_name, location)
+SELECT 'Seed Store ' || g, 'Seed City ' || (g %% 50)
+FROM generate_series(1, %(stores)s) g;
+
+WITH managers AS (
+    SELECT array_agg(user_id) AS ids FROM public.users WHERE username LIKE 'seed_manager_%%'
+), employees AS (
+    SELECT array_agg(user_id) AS ids FROM public.users WHERE username LIKE 'seed_employee_%%'
+), seeded_stores AS (
+    SELECT array_agg(store_id) AS ids FROM public.stores WHERE store_name LIKE 'Seed Store %%'
+)
+INSERT INTO public.storeassignments (user_id, store_id, assigned_by, assigned_visit_date, actual_visit_date, status)
+SELECT
+    e.ids[1 + g %% array_length(e.ids, 1)],
+    s.ids[1 + (g * 7) %% array_length(s.ids, 1)],
+    m.ids[1 + g %% array_length(m.ids, 1)],
+    DATE '2024-01-01' + (g %% 365),
+    CASE WHEN g %% 4 = 0 THEN NULL ELSE TIMESTAMP '2024-01-01' + (g %% 365) * INTERVAL '1 day' END,
+    (ARRAY['assigned', 'visited', 'analysed', 'analysed'])[1 + g %% 4]
+FROM generate_series(1, %(assignments)s) g, managers m, employees e, seeded_stores s;
+
+INSERT INTO public.storeassignmentimages (assignment_id, image_url, upload_time, status, purity, abused, emptyy, detected_objects, phash)
+SELECT
+    sa.assignment_id,
+    'https://example.invalid/' || sa.assignment_id || '/' || i || '.jpg',
+    COALESCE(sa.actual_visit_date, now()) + i * INTERVAL '1 minute',
+    CASE WHEN sa.status = 'analysed' THEN 'analysed' ELSE 'uploaded' END,
+    'Pure', 'No', 'No', '[]',
+    CASE WHEN sa.status = 'analysed' THEN lpad(to_hex(sa.assignment_id * 10 + i), 16, '0') END
+FROM public.storeassignments sa
+CROSS JOIN generate_series(1, %(images_per_assignment)s) i
+WHERE sa.status <> 'assigned';
+
+INSERT INTO public.model_calls (image_id, assignment_id, backend, model_name, latency_ms, input_tokens, output_tokens, success, created_at)
+SELECT sai.image_id, sai.assignment_id, 'gemini', 'seed', 1000 + sai.image_id %% 500, 1500, 200, true, sai.upload_time
+FROM public.storeassignmentimages sai
+WHERE sai.status = 'analysed';
+
+ANALYZE public.users;
+ANALYZE public.stores;
+ANALYZE public.storeassignments;
+ANALYZE public.storeassignmentimages;
+ANALYZE public.model_calls;
+"""
+
+def sample_parameters(cursor) -> dict:
+    cursor.execute(
+        """
+        SELECT assigned_by, user_id, assignment_id, store_id, assigned_visit_date
+        FROM public.storeassignments
+        WHERE status <> 'assigned'
+        ORDER BY assignment_id DESC
+        LIMIT 1
+        """
+    )
+    row = cursor.fetchone()
+    if row is None:
+        sys.exit("No assignments found; seed the database first (--seed).")
+    manager_id, user_id, assignment_id, store_id, visit_date = row
+    return {
+        "manager_id": manager_id, "user_id": user_id, "assignment_id": assignment_id,
+        "store_id": store_id, "visit_date": visit_date,
+    }
+
+def plan_checks(params: dict) -> list:
+    # Manager dashboards and exports cover one manager over a month.
+    filters = {
+        "manager_id": params["manager_id"], "store_id": None,
+        "date_from": params["visit_date"].replace(day=1), "date_to": params["visit_date"],
+    }
+    usage_filters = {"manager_id": params["manager_id"], "date_from": filters["date_from"], "date_to": filters["date_to"]}
+    return [
+        ("manager.get_visits", GET_VISITS_QUERY, (params["manager_id"],)),
+        ("manager.get_completed_visits", GET_COMPLETED_VISITS_QUERY, (params["manager_id"],)),
+        ("manager.get_visit_summaries", GET_VISIT_SUMMARIES_QUERY, (params["manager_id"],)),
+        ("user.get_visits", GET_USER_VISITS_QUERY, (params["user_id"],)),
+        ("report_service.fetch_assignment_data", FETCH_ASSIGNMENT_QUERY, {"assignment_id": params["assignment_id"]}),
+        ("report_service.fetch_assignments_data", FETCH_ASSIGNMENTS_QUERY, {"assignment_ids": [params["assignment_id"]]}),
+        ("report_service.fetch_assignment_ids", ASSIGNMENT_IDS_QUERY, dict(filters, store_id=None)),
+        ("export_service.iter_export_batches", EXPORT_QUERY, filters),
+        *[
+            (f"usage_service.model_usage[{group_by}]", MODEL_USAGE_QUERY.format(key=key, group_by=group_by), usage_filters)
+            for group_by, key in USAGE_GROUPS.items()
+        ],
+        ("analysis_service.get_images", GET_IMAGES_QUERY, (params["assignment_id"],)),
+        ("analysis_service.load_store_hash_index", STORE_HASHES_QUERY, (params["store_id"],)),
+    ]
+
+def seq_scans(plan: dict) -> list:
+    found = []
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        if node.get("Node Type") == "Seq Scan" and node.get("Relation Name") in LARGE_TABLES:
+            found.append(node["Relation Name"])
+        stack.extend(node.get("Plans", []))
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", action="store_true", help="Insert synthetic rows first (disposable databases only).")
+    parser.add_argument("--assignments", type=int, default=100000)
+    parser.add_argument("--images-per-assignment", type=int, default=3)
+    parser.add_argument("--stores", type=int, default=2000)
+    parser.add_argument("--employees", type=int, default=2000)
+    parser.add_argument("--managers", type=int, default=50)
+    args = parser.parse_args()
+
+    result = connect_to_db()
+    if result is None:
+        sys.exit("Database connection failed")
+    cursor, connection = result
+    try:
+        if args.seed:
+            cursor.execute(SEED_SQL, {
+                "assignments": args.assignments,
+                "images_per_assignment": args.images_per_assignment,
+                "stores": args.stores,
+                "employees": args.employees,
+                "managers": args.managers,
+            })
+            connection.commit()
+            print(f"Seeded {args.assignments} assignments.")
+
+        failures = 0
+        for name, query, query_params in plan_checks(sample_parameters(cursor)):
+            cursor.execute("EXPLAIN (FORMAT JSON) " + query.strip().rstrip(";"), query_params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            scans = seq_scans(plan[0]["Plan"])
+            if scans:
+                failures += 1
+                print(f"❌ {name}: sequential scan on {', '.join(sorted(set(scans)))}")
+            else:
+                print(f"✅ {name}")
+        connection.rollback()
+    finally:
+        connection.close()
+
+    if failures:
+        sys.exit(f"{failures} quer{'y' if failures == 1 else 'ies'} fell back to a sequential scan on a large table.")
+
+if __name__ == "__main__":
+    main()
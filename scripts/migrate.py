@@ -0,0 +1,125 @@
+"""
+Apply the versioned SQL migrations in migrations/ in filename order.
+
+Each file runs in its own transaction and is recorded in public.schema_migrations,
+so re-running only applies new files. Migrations are written to be idempotent,
+so databases that predate this runner can be brought under it safely.
+
+A file whose first line is "-- migrate: no-transaction" instead runs statement
+by statement in autocommit mode, which CREATE INDEX CONCURRENTLY requires. If
+such a file fails part-way, its finished statements stay applied and the file
+is retried from the start on the next run.
+
+Usage:
+    python scripts/migrate.py            # apply pending migrations
+    python scripts/migrate.py --status   # list applied and pending migrations
+"""
+import argparse
+import os
+import re
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from database import connect_to_db
+
+MIGRATIONS_DIR = os.path.join(ROOT, "migrations")
+NO_TRANSACTION_MARKER = "-- migrate: no-transaction"
+
+# Tokens that can hide a ';': comments, quoted strings and dollar-quoted bodies.
+_SQL_TOKEN = re.compile(r"--[^\n]*|/\*.*?\*/|'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|(\$[A-Za-z_0-9]*\$).*?\1|;", re.S)
+
+INVALID_INDEXES_QUERY = """
+    SELECT c.relname
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE NOT i.indisvalid AND n.nspname = 'public'
+"""
+
+def list_migrations() -> list:
+    return sorted(name for name in os.listdir(MIGRATIONS_DIR) if name.endswith(".sql"))
+
+def split_statements(sql: str) -> list:
+    """
+    Split a migration into statements on top-level semicolons.
+    """
+    statements = []
+    start = 0
+    for match in _SQL_TOKEN.finditer(sql):
+        if match.group(0) == ";":
+            statements.append(sql[start:match.start()])
+            start = match.end()
+    statements.append(sql[start:])
+    return [statement.strip() for statement in statements if _SQL_TOKEN.sub("", statement).strip()]
+
+def apply_without_transaction(connection, cursor, name: str, sql: str):
+    connection.autocommit = True
+    try:
+        for statement in split_statements(sql):
+            cursor.execute(statement)
+        cursor.execute("INSERT INTO public.schema_migrations (version) VALUES (%s)", (name[:-4],))
+    except Exception:
+        # An interrupted CREATE INDEX CONCURRENTLY leaves an invalid index that
+        # IF NOT EXISTS would then skip; it must be dropped before retrying.
+        cursor.execute(INVALID_INDEXES_QUERY)
+        invalid = [row[0] for row in cursor.fetchall()]
+        if invalid:
+            print(f"⚠️ Invalid indexes to drop before re-running: {', '.join(invalid)}")
+        raise
+    finally:
+        connection.autocommit = False
+
+def applied_versions(cursor) -> set:
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS public.schema_migrations (
+            version    TEXT PRIMARY KEY,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        """
+    )
+    cursor.execute("SELECT version FROM public.schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--status", action="store_true", help="Only list applied and pending migrations.")
+    args = parser.parse_args()
+
+    result = connect_to_db()
+    if result is None:
+        sys.exit("Database connection failed")
+    cursor, connection = result
+    try:
+        applied = applied_versions(cursor)
+        connection.commit()
+
+        pending = [name for name in list_migrations() if name[:-4] not in applied]
+        if args.status:
+            for name in list_migrations():
+                print(f"{'applied' if name[:-4] in applied else 'pending'}  {name}")
+            return
+
+        for name in pending:
+            with open(os.path.join(MIGRATIONS_DIR, name), encoding="utf-8") as f:
+                sql = f.read()
+            try:
+                if sql.lstrip().startswith(NO_TRANSACTION_MARKER):
+                    apply_without_transaction(connection, cursor, name, sql)
+                else:
+                    cursor.execute(sql)
+                    cursor.execute("INSERT INTO public.schema_migrations (version) VALUES (%s)", (name[:-4],))
+                    connection.commit()
+                print(f"✅ Applied {name}")
+            except Exception as e:
+                connection.rollback()
+                sys.exit(f"❌ Migration {name} failed: {e}")
+
+        if not pending:
+            print("Database is up to date.")
+    finally:
+        connection.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""
+Re-apply the current catalog and scoring rules to stored detections.
+
+Recomputes purity, abused and empty from each analysed image's detected_objects
+without calling the detector, and stamps the current catalog version. Runs as a
+dry run unless --apply is given.
+
+Usage:
+    python scripts/rescore.py                      # dry run over all analysed images
+    python scripts/rescore.py --assignment-id 42   # dry run for one assignment
+    python scripts/rescore.py --apply              # write the changes
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from service.rescore_service import RESCORE_BATCH_SIZE, rescore_detections
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apply", action="store_true", help="write changes instead of only reporting them")
+    parser.add_argument("--assignment-id", type=int, help="limit to one assignment")
+    parser.add_argument("--batch-size", type=int, default=RESCORE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    summary = rescore_detections(dry_run=not args.apply, assignment_id=args.assignment_id, batch_size=args.batch_size)
+    print(json.dumps(summary, indent=2, default=str))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import collections
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Analyses allowed to run at once in this worker, and how many more may wait.
+ANALYSIS_MAX_CONCURRENT = int(os.getenv("ANALYSIS_MAX_CONCURRENT", "2"))
+ANALYSIS_MAX_QUEUE = int(os.getenv("ANALYSIS_MAX_QUEUE", "20"))
+# Assumed duration of one analysis until real runs have been observed.
+ANALYSIS_DEFAULT_SECONDS = float(os.getenv("ANALYSIS_DEFAULT_SECONDS", "60"))
+
+class QueueFullError(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Analysis queue is full; retry in {retry_after} seconds.")
+        self.retry_after = retry_after
+
+class AnalysisAdmission:
+    """
+    Admission control for run_analysis.
+
+    - Single-flight: a second request for an assignment that is queued or
+      running joins that run instead of starting another one. A forced
+      request that joins an unforced run queues one forced re-run to start
+      when the current run finishes.
+    - At most max_concurrent analyses run at once on a dedicated pool, so
+      analyses never occupy the API's own threadpool.
+    - At most max_queue more may wait; beyond that submit raises
+      QueueFullError with a Retry-After estimate.
+    """
+
+    def __init__(self, run, max_concurrent: int = ANALYSIS_MAX_CONCURRENT, max_queue: int = ANALYSIS_MAX_QUEUE):
+        self.run = run
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="analysis")
+        self._inflight = {}
+        self._forced = set()
+        self._followups = set()
+        self._durations = collections.deque(maxlen=50)
+        self._lock = threading.Lock()
+
+    def submit(self, assignment_id: int, force: bool = False):
+        """
+        Start (or join) the analysis of an assignment.
+
+        Returns:
+            tuple: (future, joined, followup) where joined is True if an
+            in-flight run was reused and followup is True if a forced re-run
+            was queued behind it.
+
+        Raises:
+            QueueFullError: If the concurrency and queue limits are both exhausted.
+        """
+        with self._lock:
+            future = self._inflight.get(assignment_id)
+            if future is not None:
+                followup = force and assignment_id not in self._forced
+                if followup:
+                    self._followups.add(assignment_id)
+                return future, True, followup
+            if len(self._inflight) >= self.max_concurrent + self.max_queue:
+                raise QueueFullError(self._retry_after())
+            future = self._start(assignment_id, force)
+        future.add_done_callback(lambda f: self._release(assignment_id, f))
+        return future, False, False
+
+    def inflight(self) -> list:
+        with self._lock:
+            return list(self._inflight)
+
+    def _run(self, assignment_id: int, force: bool):
+        started = time.monotonic()
+        try:
+            return self.run(assignment_id, force)
+        finally:
+            self._durations.append(time.monotonic() - started)
+
+    def _start(self, assignment_id: int, force: bool):
+        # Caller holds self._lock.
+        future = self._executor.submit(self._run, assignment_id, force)
+        self._inflight[assignment_id] = future
+        if force:
+            self._forced.add(assignment_id)
+        else:
+            self._forced.discard(assignment_id)
+        return future
+
+    def _release(self, assignment_id: int, future):
+        followup = None
+        with self._lock:
+            if self._inflight.get(assignment_id) is future:
+                del self._inflight[assignment_id]
+                self._forced.discard(assignment_id)
+                if assignment_id in self._followups:
+                    self._followups.discard(assignment_id)
+                    followup = self._start(assignment_id, True)
+        error = future.exception()
+        if error is not None:
+            print(f"❌ Analysis failed for assignment_id={assignment_id}: {error}")
+        if followup is not None:
+            followup.add_done_callback(lambda f: self._release(assignment_id, f))
+
+    def _retry_after(self) -> int:
+        durations = list(self._durations)
+        average = sum(durations) / len(durations) if durations else ANALYSIS_DEFAULT_SECONDS
+        waves = math.ceil((len(self._inflight) - self.max_concurrent + 1) / self.max_concurrent)
+        return max(1, math.ceil(average * max(1, waves)))
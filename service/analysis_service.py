@@ -1,9 +1,23 @@
+import hashlib
 import json
 import os
+import time
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import google.generativeai as genai
 from database import connect_to_db
+from service.detection_schema import RESPONSE_SCHEMA, parse_detected_objects
+from service.context_cache_service import GEMINI_CONTEXT_CACHE, GenaiCacheClient, PromptCache
+from service.deadline_service import (
+    ASSIGNMENT_DEADLINE_SECONDS, HEDGE_IMAGE_FETCHES, HEDGE_MODEL_CALLS, IMAGE_FETCH_TIMEOUT, MODEL_CALL_TIMEOUT,
+    Deadline, DeadlineExceeded, LatencyTracker, hedged_call,
+)
+from service.detector_service import DETECTOR_BACKEND, GeminiDetector, build_detector
+from service.phash_service import BKTree, PHASH_MAX_DISTANCE, dhash, hash_to_hex, hex_to_hash, is_distinctive
+from service.prefilter_service import PREFILTER_VERSION, prefilter_image
+from service.progress_service import publish_progress
+from service.summary_service import refresh_assignment_summary
+from service.usage_service import record_model_call
 import requests
 import re
 from PIL import Image, ExifTags
@@ -11,15 +25,32 @@ from io import BytesIO
 from dotenv import load_dotenv, find_dotenv
 load_dotenv(find_dotenv())
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# Only the gemini and cascade detector backends talk to Gemini.
+USES_GEMINI = DETECTOR_BACKEND in ("gemini", "cascade")
 
-if not GOOGLE_API_KEY:
+if USES_GEMINI and not GOOGLE_API_KEY:
     raise EnvironmentError("GOOGLE_API_KEY is not set in the environment.")
 
-genai.configure(api_key=GOOGLE_API_KEY)
-SYSTEM_INSTRUCTION_PROMPT = os.getenv("SYSTEM_INSTRUCTION_PROMPT")
-if not SYSTEM_INSTRUCTION_PROMPT:
+# GEMINI_API_ENDPOINT points the client at another host, e.g. a local stub server.
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+SYSTEM_INSTRUCTION_PROMPT = os.getenv("SYSTEM_INSTRUCTION_PROMPT", "")
+if USES_GEMINI and not SYSTEM_INSTRUCTION_PROMPT:
     raise EnvironmentError("SYSTEM_INSTRUCTION_PROMPT is not set in the environment.")
-MODEL = genai.GenerativeModel('gemini-2.5-flash', system_instruction=SYSTEM_INSTRUCTION_PROMPT)
+MODEL_NAME = 'gemini-2.5-flash'
+# The Gemini client is only built for backends that use it; GenerativeModel
+# rejects an empty system instruction, which the local backends do not need.
+GENERATION_CONFIG = None
+MODEL = None
+if USES_GEMINI:
+    if GEMINI_API_ENDPOINT:
+        genai.configure(api_key=GOOGLE_API_KEY, transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+    else:
+        genai.configure(api_key=GOOGLE_API_KEY)
+    GENERATION_CONFIG = genai.GenerationConfig(
+        response_mime_type="application/json",
+        response_schema=RESPONSE_SCHEMA,
+    )
+    MODEL = genai.GenerativeModel(MODEL_NAME, system_instruction=SYSTEM_INSTRUCTION_PROMPT, generation_config=GENERATION_CONFIG)
 
 coca_cola_products = [
         "Coca-Cola Original",
@@ -49,6 +80,31 @@ coca_cola_products = [
         "Honest Kids",
         "Core Power"
     ]
+
+# Bump when the purity/abused/empty rules in evaluate_cooler_smart change.
+RULES_VERSION = "1"
+
+def _short_hash(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:12]
+
+# Every stored result is tagged with the version it was produced under, so
+# re-analysis only has to touch images whose model, prompt or catalog changed.
+# Format: "<detector version>:<catalog hash>"; for Gemini the detector version
+# is "<model>:<prompt hash>".
+DETECTION_VERSION = f"{MODEL_NAME}:{_short_hash(SYSTEM_INSTRUCTION_PROMPT + json.dumps(RESPONSE_SCHEMA, sort_keys=True))}"
+PROMPT_CACHE = None
+if USES_GEMINI and GEMINI_CONTEXT_CACHE:
+    PROMPT_CACHE = PromptCache(GenaiCacheClient(GENERATION_CONFIG), f"models/{MODEL_NAME}", SYSTEM_INSTRUCTION_PROMPT, MODEL)
+GEMINI_DETECTOR = GeminiDetector(MODEL, DETECTION_VERSION, PROMPT_CACHE, MODEL_NAME) if USES_GEMINI else None
+DETECTOR = build_detector(DETECTOR_BACKEND, gemini=GEMINI_DETECTOR)
+CATALOG_VERSION = _short_hash(RULES_VERSION + "|" + "|".join(coca_cola_products))
+ANALYSIS_VERSION = f"{DETECTOR.version}:{CATALOG_VERSION}"
+# Pre-filter rejections do not depend on the detector or catalog, only on the
+# pre-filter configuration.
+REJECTION_VERSION = f"prefilter:{PREFILTER_VERSION}"
+# Recent latencies that set the hedge point for image fetches and model calls.
+FETCH_LATENCY = LatencyTracker()
+MODEL_LATENCY = LatencyTracker()
 def normalize_brand(name):
     """Normalize brand name by removing non-alphanumeric characters and lowering case."""
     if not name:
@@ -127,24 +183,42 @@ def evaluate_cooler_smart(llm_response):
     except Exception as e:
         raise RuntimeError(f"Unexpected error in evaluate_cooler_smart: {e}")
 
+GET_IMAGES_QUERY = """
+    SELECT image_id, image_url, status, analysis_version
+    FROM storeassignmentimages
+    WHERE assignment_id = %s
+    ORDER BY image_id
+"""
+
+STORE_HASHES_QUERY = """
+    SELECT sai.image_id, sai.assignment_id, sai.phash
+    FROM storeassignmentimages sai
+    JOIN storeassignments sa ON sai.assignment_id = sa.assignment_id
+    WHERE sa.store_id = %s
+      AND sai.phash IS NOT NULL
+"""
+
+STORED_DETECTION_QUERY = """
+    SELECT detected_objects, chargeability, auditable_photo
+    FROM storeassignmentimages
+    WHERE image_id = %s
+      AND status = 'analysed'
+      AND analysis_version = %s
+"""
+
 def get_images(assignment_id: int):
     """
-    Fetch all image IDs and URLs for a given assignment ID.
+    Fetch all image IDs, URLs, statuses and analysis versions for a given assignment ID.
     """
     connection = None
     try:
         curr, connection = connect_to_db()
         cursor = connection.cursor(cursor_factory=RealDictCursor)
         
-        query = """
-            SELECT image_id, image_url
-            FROM storeassignmentimages
-            WHERE assignment_id = %s
-        """
-        cursor.execute(query, (assignment_id,))
+        cursor.execute(GET_IMAGES_QUERY, (assignment_id,))
         results = cursor.fetchall()
         
-        return results  # list of dicts: [{'image_id': 1, 'image_url': '...'}, ...]
+        return results  # list of dicts: [{'image_id': 1, 'image_url': '...', 'status': '...', 'analysis_version': '...'}, ...]
     
     except Exception as e:
         print(f"Error while fetching images: {e}")
@@ -154,22 +228,125 @@ def get_images(assignment_id: int):
         if connection:
             connection.close()
 
-def fetch_image_from_url(image_url: str) -> Image.Image:
+def get_assignment_context(assignment_id: int) -> dict:
+    """
+    Fetch the store and manager an assignment belongs to.
+    """
+    connection = None
+    try:
+        curr, connection = connect_to_db()
+        cursor = connection.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(
+            "SELECT store_id, assigned_by FROM storeassignments WHERE assignment_id = %s",
+            (assignment_id,)
+        )
+        return cursor.fetchone() or {}
+
+    except Exception as e:
+        print(f"Error while fetching assignment context: {e}")
+        return {}
+
+    finally:
+        if connection:
+            connection.close()
+
+def load_store_hash_index(store_id: int) -> BKTree:
+    """
+    Build a BK-tree of the perceptual hashes of every photo already stored for a store.
+    Items are (image_id, assignment_id) tuples.
+    """
+    index = BKTree()
+    if store_id is None:
+        return index
+    connection = None
+    try:
+        curr, connection = connect_to_db()
+        cursor = connection.cursor()
+        cursor.execute(STORE_HASHES_QUERY, (store_id,))
+        for image_id, assignment_id, phash in cursor.fetchall():
+            value = hex_to_hash(phash)
+            if is_distinctive(value):
+                index.add(value, (image_id, assignment_id))
+        return index
+
+    except Exception as e:
+        print(f"Error while loading hash index for store_id={store_id}: {e}")
+        return index
+
+    finally:
+        if connection:
+            connection.close()
+
+def load_stored_detection(image_id: int):
+    """
+    Rebuild the raw detection of an image already analysed at the current
+    ANALYSIS_VERSION, so a near-duplicate can reuse it without a detector call.
+    Returns None if the image has no current detection.
+    """
+    connection = None
+    try:
+        curr, connection = connect_to_db()
+        cursor = connection.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(STORED_DETECTION_QUERY, (image_id, ANALYSIS_VERSION))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        objects = parse_detected_objects(row["detected_objects"])
+        if objects is None:
+            return None
+        return {
+            "objects": objects,
+            "chargeability_percentage": row["chargeability"],
+            "auditable": row["auditable_photo"],
+        }
+
+    except Exception as e:
+        print(f"Error while loading stored detection for image_id={image_id}: {e}")
+        return None
+
+    finally:
+        if connection:
+            connection.close()
+
+def _download_image(image_url: str, timeout: float, cancel=None) -> Image.Image:
+    # requests' timeout applies per socket operation, so the total is enforced here too.
+    started = time.monotonic()
+    with requests.get(image_url, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        body = BytesIO()
+        for chunk in response.iter_content(chunk_size=65536):
+            if cancel is not None and cancel.is_set():
+                raise DeadlineExceeded("image fetch cancelled")
+            if time.monotonic() - started > timeout:
+                raise DeadlineExceeded(f"image fetch took longer than {timeout:.1f}s")
+            body.write(chunk)
+    FETCH_LATENCY.record(time.monotonic() - started)
+    body.seek(0)
+    return Image.open(body)
+
+def fetch_image_from_url(image_url: str, deadline: Deadline = None) -> Image.Image:
     """
     Fetch an image from the given URL and return a PIL Image object.
 
+    The fetch gets IMAGE_FETCH_TIMEOUT or what is left of the deadline,
+    whichever is less. With HEDGE_IMAGE_FETCHES, a second download is started
+    once the first is slower than the recent p95 and the slower one is cancelled.
+
     Args:
         image_url (str): URL of the image to fetch.
+        deadline (Deadline, optional): Budget of the surrounding run.
 
     Returns:
-        PIL.Image.Image: The image object.
+        PIL.Image.Image: The image object, or None if it could not be fetched in time.
     """
     try:
-        response = requests.get(image_url, timeout=10)
-        response.raise_for_status()
-        img = Image.open(BytesIO(response.content))
+        timeout = deadline.timeout_for(IMAGE_FETCH_TIMEOUT) if deadline else IMAGE_FETCH_TIMEOUT
+        hedge_after = FETCH_LATENCY.hedge_delay() if HEDGE_IMAGE_FETCHES else None
+        img, hedged = hedged_call(lambda cancel: _download_image(image_url, timeout, cancel), hedge_after, timeout)
+        if hedged:
+            print(f"Hedged image fetch for {image_url}")
         return img
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, DeadlineExceeded) as e:
         print(f"Error fetching image from {image_url}: {e}")
         return None
 
@@ -219,83 +396,319 @@ def found_sga_photo(file: Image.Image) -> str:
         print(f"failed at pos 4 - Exception: {e}")
         return "No"
 
-def identify_objects_direct_from_file(file: Image.Image) -> dict:
+def identify_objects_direct_from_file(file: Image.Image, stats: dict = None, deadline: Deadline = None) -> dict:
     """
-    Identifies objects and brands from a binary image file using Gemini API.
+    Identifies objects and brands from a binary image file using the
+    configured detector backend (DETECTOR_BACKEND: gemini, onnx, fake or cascade).
+
+    The Gemini backend is constrained to RESPONSE_SCHEMA; its output is
+    validated into a DetectionResult, with a repair pass for fenced or truncated JSON.
+
+    The call gets MODEL_CALL_TIMEOUT or what is left of the deadline. With
+    HEDGE_MODEL_CALLS a duplicate call is made once the first is slower than
+    the recent p95; it is counted as a retry in stats.
 
     Args:
         file (BinaryIO): Uploaded image file.
+        stats (dict, optional): Filled with call accounting (backend, model, tokens, retries, cache hit).
+        deadline (Deadline, optional): Budget of the surrounding run.
 
     Returns:
-        dict: Parsed JSON response from Gemini model.
+        dict: Detection result with 'objects', 'chargeability_percentage' and 'auditable'.
+
+    Raises:
+        ValueError: If the detector output cannot be parsed.
+        RuntimeError: If the detector itself fails or runs out of time.
+    """
+    stats = {} if stats is None else stats
+    timeout = deadline.timeout_for(MODEL_CALL_TIMEOUT) if deadline else MODEL_CALL_TIMEOUT
+    hedge_after = MODEL_LATENCY.hedge_delay() if HEDGE_MODEL_CALLS else None
+
+    def attempt(cancel):
+        attempt_stats = {}
+        started = time.monotonic()
+        # A hedged pair must not share one PIL image across threads.
+        image = file.copy() if hedge_after is not None else file
+        result = DETECTOR.detect(image, attempt_stats, timeout)
+        MODEL_LATENCY.record(time.monotonic() - started)
+        return result, attempt_stats
+
+    (result, attempt_stats), hedged = hedged_call(attempt, hedge_after, timeout)
+    stats.update(attempt_stats)
+    if hedged:
+        stats["retries"] = stats.get("retries", 0) + 1
+    return result
+
+def result_version(object_result_raw: dict):
     """
+    Version to store with a detection result: ANALYSIS_VERSION, or NULL for a
+    degraded fallback result or one repaired from truncated model output, so
+    needs_analysis picks the image up again.
+    """
+    if object_result_raw.get("degraded") or object_result_raw.get("repaired"):
+        return None
+    return ANALYSIS_VERSION
+
+def needs_analysis(image: dict, force: bool = False) -> bool:
+    """
+    Decide whether an image has to be (re-)analysed.
+
+    New and failed images always qualify; analysed images only qualify when
+    they were produced under a different ANALYSIS_VERSION, and pre-filter
+    rejected images when the pre-filter configuration (REJECTION_VERSION)
+    changed, or when forced.
+    """
+    if force:
+        return True
+    if image.get("status") == "analysed":
+        return image.get("analysis_version") != ANALYSIS_VERSION
+    if image.get("status") == "rejected":
+        return image.get("analysis_version") != REJECTION_VERSION
+    return True
+
+def refresh_summary(assignment_id: int, analysed: bool = True):
+    """
+    Refresh an assignment's summary in its own transaction. Errors are only logged.
+    """
+    connection = None
     try:
-        print("Started identifying objects and brands in the image.")
-        image = file
-        response = MODEL.generate_content([image])
-        print("Got Response!!")  # Debug output
-        # Clean and convert the string response to JSON
-        response_text = response.text.strip("```json").strip("```").strip()
-        print(response_text)  # Debug output
-        parsed = json.loads(response_text)
-        return parsed
-
-    except json.JSONDecodeError:
-        raise ValueError("Failed to parse model output as JSON.")
+        curr, connection = connect_to_db()
+        refresh_assignment_summary(connection.cursor(), assignment_id, analysed=analysed)
+        connection.commit()
     except Exception as e:
-        raise RuntimeError(f"Gemini model failed: {e}")
-    
-def run_analysis(assignment_id: int):
+        print(f"Error refreshing summary for assignment_id={assignment_id}: {e}")
+    finally:
+        if connection:
+            connection.close()
+
+def mark_image_failed(image_id: int, reason: str):
     """
-    Run analysis for all images of a given assignment.
-    For each image:
+    Record a per-image failure and its reason so the next run picks the image up again.
+    The assignment summary is refreshed once at the end of the run, not here.
+    """
+    connection = None
+    try:
+        curr, connection = connect_to_db()
+        cursor = connection.cursor()
+        cursor.execute(
+            """
+            UPDATE storeassignmentimages
+            SET status = %s,
+                analysis_version = NULL,
+                analysis_error = %s
+            WHERE image_id = %s
+            """,
+            ("failed", reason, image_id)
+        )
+        connection.commit()
+        print(f"   ⚠️ Marked image_id={image_id} as failed: {reason}")
+    except Exception as e:
+        print(f"Error marking image_id={image_id} as failed: {e}")
+    finally:
+        if connection:
+            connection.close()
+
+def mark_image_rejected(image_id: int, reason: str, found_sga_result: str, image_hash: int):
+    """
+    Record that the pre-filter judged an image not auditable, without calling the detector.
+    Results of an earlier analysis of the same image are cleared. The assignment
+    summary is refreshed once at the end of the run, not here.
+    """
+    connection = None
+    try:
+        curr, connection = connect_to_db()
+        cursor = connection.cursor()
+        cursor.execute(
+            """
+            UPDATE storeassignmentimages
+            SET status = %s,
+                found_sga_photo = %s,
+                auditable_photo = %s,
+                rejection_reason = %s,
+                analysis_version = %s,
+                phash = %s,
+                analysis_error = NULL,
+                purity = NULL,
+                abused = NULL,
+                emptyy = NULL,
+                chargeability = NULL,
+                detected_objects = NULL
+            WHERE image_id = %s
+            """,
+            ("rejected", found_sga_result, "No", reason, REJECTION_VERSION, hash_to_hex(image_hash), image_id)
+        )
+        connection.commit()
+        print(f"   🚫 Rejected image_id={image_id} before detection: {reason}")
+    except Exception as e:
+        print(f"Error marking image_id={image_id} as rejected: {e}")
+    finally:
+        if connection:
+            connection.close()
+
+def run_analysis(assignment_id: int, force: bool = False, deadline: Deadline = None):
+    """
+    Run analysis for the images of a given assignment that need it.
+    Images already analysed under the current ANALYSIS_VERSION are skipped
+    unless force=True.
+    The run is bounded by deadline (ASSIGNMENT_DEADLINE_SECONDS by default);
+    images it does not reach in time are marked failed for the next run.
+    For each remaining image:
       - Fetch the image
       - Check if it's an original (found_sga_photo)
-      - Identify objects using Gemini
+      - Reuse the detection of a near-duplicate photo, or flag reuse across visits
+      - Skip clearly non-auditable photos with a local pre-filter
+      - Identify objects using the configured detector
       - Print results with assignment_id, image_id
+    Progress (started, image_done, completed, failed) is published to
+    service/progress_service as each step finishes. The assignment summary is
+    recomputed once, with the final status update, rather than per image.
     """
-    print(f"🔍 Starting analysis for assignment_id={assignment_id}")
+    print(f"🔍 Starting analysis for assignment_id={assignment_id} (version={ANALYSIS_VERSION}, force={force})")
+    deadline = deadline or Deadline(ASSIGNMENT_DEADLINE_SECONDS)
+    context = get_assignment_context(assignment_id)
+    manager_id = context.get("assigned_by")
 
     # Step 1: Get all images for this assignment
     images = get_images(assignment_id)
     if not images:
         print(f"No images found for assignment_id={assignment_id}")
+        publish_progress("completed", assignment_id, manager_id, total=0, processed=0)
         return {}
 
+    pending = [img for img in images if needs_analysis(img, force)]
+    skipped = len(images) - len(pending)
+    if skipped:
+        print(f"⏭️ Skipping {skipped} image(s) already analysed under version {ANALYSIS_VERSION}")
+    if not pending:
+        print(f"Nothing to re-analyse for assignment_id={assignment_id}")
+        publish_progress("completed", assignment_id, manager_id, total=0, processed=0, skipped=skipped)
+        return {}
+    publish_progress("started", assignment_id, manager_id, total=len(pending), skipped=skipped)
+
+    # Near-duplicate lookups are scoped per store: earlier visits' photos come
+    # from the database, this run's photos are indexed as they are processed.
+    store_index = load_store_hash_index(context.get("store_id"))
+    run_index = BKTree()
+
     results = {}
 
+    def image_done(image_id: int, status: str, **fields):
+        publish_progress("image_done", assignment_id, manager_id, image_id=image_id, status=status,
+                         processed=len(results), total=len(pending), **fields)
+
     # Step 2: Loop over each image
-    for img in images:
+    for img in pending:
         image_id = img["image_id"]
         image_url = img["image_url"]
         print(f"\n📸 Processing image_id={image_id}, url={image_url}")
 
+        if deadline.expired():
+            mark_image_failed(image_id, "deadline exceeded")
+            results[image_id] = {
+                "found_sga_photo": "error",
+                "object_detection": "error",
+                "error": "deadline exceeded"
+            }
+            image_done(image_id, "failed", error="deadline exceeded")
+            continue
+
         # Step 3: Fetch image
-        pil_img = fetch_image_from_url(image_url)
+        pil_img = fetch_image_from_url(image_url, deadline)
         if not pil_img:
             print(f"❌ Failed to fetch image_id={image_id}")
+            mark_image_failed(image_id, "image fetch failed")
             results[image_id] = {
                 "found_sga_photo": "error",
                 "object_detection": "error"
             }
+            image_done(image_id, "failed", error="image fetch failed")
             continue
 
         # Step 4: Run found_sga_photo
         found_sga_result = found_sga_photo(pil_img)
 
-        object_result_raw = identify_objects_direct_from_file(pil_img)
-        objects_present = object_result_raw.get("objects", [])
-        # Step 6: Pass raw object detection result to cooler evaluator
-        object_result = evaluate_cooler_smart(object_result_raw)
+        # Step 5: Perceptual hash - reuse detections for near-identical shots in
+        # this visit (this run or an earlier one), and flag photos re-submitted
+        # from another visit. Blank or flat frames are never matched.
+        image_hash = dhash(pil_img)
+        distinctive = is_distinctive(image_hash)
+        duplicate_of = None
+        object_result_raw = None
+        run_matches = run_index.search(image_hash, PHASH_MAX_DISTANCE) if distinctive else []
+        if run_matches:
+            distance, (duplicate_of, object_result_raw) = run_matches[0]
+            print(f"   ♻️ Near-duplicate of image_id={duplicate_of} (distance={distance}), reusing its detection")
+        elif distinctive:
+            for distance, (match_id, match_assignment) in store_index.search(image_hash, PHASH_MAX_DISTANCE):
+                if match_id == image_id:
+                    continue
+                if match_assignment == assignment_id:
+                    stored = load_stored_detection(match_id)
+                    if stored is None:
+                        continue
+                    duplicate_of, object_result_raw = match_id, stored
+                    print(f"   ♻️ Near-duplicate of earlier image_id={match_id} (distance={distance}), reusing its detection")
+                    break
+                duplicate_of = match_id
+                found_sga_result = "No"
+                print(f"   🚩 Photo reused from assignment_id={match_assignment} image_id={match_id} (distance={distance})")
+                break
+
+        # Step 6: Cheap local pre-filter - blurry, badly exposed or empty
+        # frames are recorded as not auditable without a Gemini call.
+        if object_result_raw is None:
+            ok, reason, metrics = prefilter_image(pil_img)
+            if not ok:
+                mark_image_rejected(image_id, reason, found_sga_result, image_hash)
+                results[image_id] = {
+                    "found_sga_photo": found_sga_result,
+                    "object_detection": "rejected",
+                    "rejection_reason": reason,
+                    "metrics": metrics
+                }
+                image_done(image_id, "rejected", rejection_reason=reason)
+                continue
+
+        # Step 7: Detect objects and pass the raw result to the cooler evaluator.
+        # A failure here is recorded against this image only, so the detections
+        # already paid for in this run are still saved.
+        try:
+            if object_result_raw is None:
+                call_stats = {}
+                started = time.perf_counter()
+                try:
+                    object_result_raw = identify_objects_direct_from_file(pil_img, call_stats, deadline)
+                    call_stats["success"] = True
+                except (ValueError, RuntimeError) as e:
+                    call_stats.update(success=False, error=str(e))
+                    raise
+                finally:
+                    call_stats["latency_ms"] = int((time.perf_counter() - started) * 1000)
+                    record_model_call(image_id, assignment_id, call_stats)
+                if distinctive:
+                    run_index.add(image_hash, (image_id, object_result_raw))
+            objects_present = object_result_raw.get("objects", [])
+            object_result = evaluate_cooler_smart(object_result_raw)
+        except (ValueError, RuntimeError) as e:
+            print(f"❌ Analysis failed for image_id={image_id}: {e}")
+            mark_image_failed(image_id, str(e))
+            results[image_id] = {
+                "found_sga_photo": found_sga_result,
+                "object_detection": "error",
+                "error": str(e)
+            }
+            image_done(image_id, "failed", error=str(e))
+            continue
 
-        # Step 7: Print and collect results
+        # Step 8: Print and collect results
         print(f"✅ assignment_id={assignment_id}, image_id={image_id}")
         print(f"   - found_sga_photo: {found_sga_result}")
         print(f"   - final_cooler_result: {object_result}")
 
         results[image_id] = {
             "found_sga_photo": found_sga_result,
-            "object_detection": object_result
+            "object_detection": object_result,
+            "duplicate_of": duplicate_of
         }
 
         # --- Extract values for DB update ---
@@ -319,22 +732,32 @@ def run_analysis(assignment_id: int):
                     chargeability = %s,
                     abused = %s,
                     emptyy = %s,
-                    detected_objects = %s
+                    detected_objects = %s,
+                    analysis_version = %s,
+                    phash = %s,
+                    duplicate_of_image_id = %s,
+                    analysis_error = NULL,
+                    rejection_reason = NULL
                 WHERE image_id = %s
             """
             cursor.execute(update_img_query, (
                 "analysed", found_sga_result, auditable, purity,
-                chargeability, abused, emptyy, str(objects_present), image_id
+                chargeability, abused, emptyy, json.dumps(objects_present), result_version(object_result_raw),
+                hash_to_hex(image_hash), duplicate_of, image_id
             ))
 
             connection.commit()
             print(f"   🔄 Updated storeassignmentimages for image_id={image_id}")
 
         except Exception as e:
+            # The images already committed in this run still count.
+            refresh_summary(assignment_id)
+            publish_progress("failed", assignment_id, manager_id, error=str(e))
             raise RuntimeError(f"❌ Error updating storeassignmentimages for image_id={image_id}: {e}")
         finally:
             if connection:
                 connection.close()
+        image_done(image_id, "analysed", purity=purity, abused=abused, empty=emptyy, duplicate_of=duplicate_of)
 
     # --- After all images are processed, update storeassignments ---
     try:
@@ -346,13 +769,16 @@ def run_analysis(assignment_id: int):
             WHERE assignment_id = %s
         """
         cursor.execute(update_assign_query, ("analysed", assignment_id))
+        refresh_assignment_summary(cursor, assignment_id, analysed=True)
         connection.commit()
         print(f"   🔄 Updated storeassignments status to 'analysed' for assignment_id={assignment_id}")
     except Exception as e:
+        publish_progress("failed", assignment_id, manager_id, error=str(e))
         raise RuntimeError(f"❌ Error updating storeassignments for assignment_id={assignment_id}: {e}")
     finally:
         if connection:
             connection.close()
 
     print(f"\n🎯 Analysis completed for assignment_id={assignment_id}")
+    publish_progress("completed", assignment_id, manager_id, total=len(pending), processed=len(results))
     return results
@@ -0,0 +1,92 @@
+import os
+from datetime import date
+from database import connect_to_db
+
+# Upper bound on rows accepted by one bulk assignment request.
+BULK_ASSIGN_MAX_ROWS = int(os.getenv("BULK_ASSIGN_MAX_ROWS", "2000"))
+
+BULK_INSERT_QUERY = """
+    INSERT INTO public.storeassignments (user_id, store_id, assigned_by, assigned_visit_date, status)
+    SELECT v.user_id, v.store_id, %s, v.visit_date, 'assigned'
+    FROM unnest(%s::int[], %s::int[], %s::date[]) AS v (user_id, store_id, visit_date)
+    ON CONFLICT (user_id, store_id, assigned_visit_date) DO NOTHING
+    RETURNING assignment_id, user_id, store_id, assigned_visit_date
+"""
+
+def assign_visits_bulk(manager_id: int, visits: list) -> list:
+    """
+    Validate and create many (user_id, store_id, visit_date) assignments with
+    a handful of set-based queries in one transaction.
+
+    A row is rejected if its date is not ISO YYYY-MM-DD, the user is not an
+    employee, the store does not exist, it repeats an earlier row of the
+    request, or the same visit is already assigned. Rejected rows do not
+    stop the valid ones from being created.
+
+    The employee and store checks mirror the assign_visit database function
+    used by the single-row endpoint. Duplicates are left to the unique index
+    on (user_id, store_id, assigned_visit_date), so a visit assigned
+    concurrently by another request is reported as already assigned.
+
+    Returns:
+        list: One dict per input row, in order, with either 'assignment_id' or 'error'.
+
+    Raises:
+        ValueError: If manager_id is not a manager.
+    """
+    results = [{"index": i} for i in range(len(visits))]
+    keys = {}
+    for i, visit in enumerate(visits):
+        try:
+            visit_date = date.fromisoformat(visit["visit_date"])
+        except (TypeError, ValueError):
+            results[i]["error"] = "visit_date must be an ISO date (YYYY-MM-DD)."
+            continue
+        keys[i] = (visit["user_id"], visit["store_id"], visit_date)
+
+    conn = None
+    try:
+        cur, conn = connect_to_db()
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM public.users WHERE user_id = %s AND user_type = 'manager'", (manager_id,))
+            if cursor.fetchone() is None:
+                raise ValueError(f"manager_id {manager_id} is not a manager.")
+
+            cursor.execute(
+                "SELECT user_id FROM public.users WHERE user_id = ANY(%s) AND user_type = 'employee'",
+                (list({key[0] for key in keys.values()}),)
+            )
+            employees = {row[0] for row in cursor.fetchall()}
+            cursor.execute(
+                "SELECT store_id FROM public.stores WHERE store_id = ANY(%s)",
+                (list({key[1] for key in keys.values()}),)
+            )
+            stores = {row[0] for row in cursor.fetchall()}
+
+            to_insert = {}
+            for i, key in keys.items():
+                if key[0] not in employees:
+                    results[i]["error"] = f"user_id {key[0]} is not an employee."
+                elif key[1] not in stores:
+                    results[i]["error"] = f"store_id {key[1]} does not exist."
+                elif key in to_insert:
+                    results[i]["error"] = f"Duplicate of row {to_insert[key]}."
+                else:
+                    to_insert[key] = i
+
+            if to_insert:
+                rows = list(to_insert)
+                cursor.execute(BULK_INSERT_QUERY, (
+                    manager_id, [key[0] for key in rows], [key[1] for key in rows], [key[2] for key in rows]
+                ))
+                for assignment_id, user_id, store_id, visit_date in cursor.fetchall():
+                    results[to_insert.pop((user_id, store_id, visit_date))]["assignment_id"] = assignment_id
+                # Rows the unique index skipped.
+                for i in to_insert.values():
+                    results[i]["error"] = "This visit is already assigned."
+        conn.commit()
+        return results
+
+    finally:
+        if conn:
+            conn.close()
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from dotenv import load_dotenv, find_dotenv
+from database import NotificationListener
+
+load_dotenv(find_dotenv())
+
+REFERENCE_CACHE_TTL = float(os.getenv("REFERENCE_CACHE_TTL", "300"))
+REFERENCE_CACHE_LISTEN = os.getenv("REFERENCE_CACHE_LISTEN", "true").lower() == "true"
+# Channel notified by the triggers in migrations/004_reference_data_notify.sql;
+# the payload is the changed table name, which is also the cache key.
+REFERENCE_CHANNEL = "reference_data_changed"
+
+class ReadThroughCache:
+    """
+    Thread-safe in-process read-through cache with a TTL per entry.
+
+    Each entry keeps the loaded data and a strong ETag of its JSON form.
+    Invalidation bumps a generation counter so a load that was already in
+    flight when the data changed is not written back into the cache.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str, loader):
+        """
+        Return (data, etag) for key, calling loader() on a miss or after expiry.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[2] > now:
+                return entry[0], entry[1]
+            generation = self._generation
+
+        data = loader()
+        body = json.dumps(jsonable_encoder(data), sort_keys=True)
+        etag = '"' + hashlib.sha1(body.encode("utf-8")).hexdigest() + '"'
+
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (data, etag, now + self.ttl)
+        return data, etag
+
+    def invalidate(self, key: str = None):
+        with self._lock:
+            self._generation += 1
+            if key:
+                self._entries.pop(key, None)
+            else:
+                self._entries.clear()
+
+reference_cache = ReadThroughCache(REFERENCE_CACHE_TTL)
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
+
+def cached_response(request: Request, content, etag: str) -> Response:
+    """
+    Return 304 Not Modified when the client already holds this ETag,
+    otherwise the JSON body tagged with it.
+    """
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=jsonable_encoder(content), headers=headers)
+
+def _handle_reference_change(table_name: str):
+    reference_cache.invalidate(table_name or None)
+
+_listener = None
+
+def start_reference_listener():
+    """
+    Start the LISTEN thread that invalidates reference data on change.
+    Without it, entries simply expire after REFERENCE_CACHE_TTL.
+    """
+    global _listener
+    if not REFERENCE_CACHE_LISTEN or _listener is not None:
+        return
+    _listener = NotificationListener(
+        {REFERENCE_CHANNEL: _handle_reference_change},
+        on_reconnect=reference_cache.invalidate,
+    )
+    _listener.start()
+
+def stop_reference_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,125 @@
+import datetime
+import hashlib
+import os
+import threading
+import time
+
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "false").lower() == "true"
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+# Extend the cache when less than this many seconds of its TTL are left.
+GEMINI_CONTEXT_CACHE_REFRESH_MARGIN = int(os.getenv("GEMINI_CONTEXT_CACHE_REFRESH_MARGIN", "300"))
+# After a failed create/refresh, use the uncached model for this long before retrying.
+GEMINI_CONTEXT_CACHE_RETRY_SECONDS = int(os.getenv("GEMINI_CONTEXT_CACHE_RETRY_SECONDS", "300"))
+
+class GenaiCacheClient:
+    """
+    Thin wrapper over google.generativeai.caching, so PromptCache can be run
+    against a local stub that implements the same four methods.
+    """
+
+    def __init__(self, generation_config=None):
+        from google.generativeai import caching
+        self._caching = caching
+        self.generation_config = generation_config
+
+    def find(self, display_name: str):
+        for cache in self._caching.CachedContent.list():
+            if cache.display_name == display_name:
+                return cache
+        return None
+
+    def create(self, model_name: str, system_instruction: str, ttl_seconds: int, display_name: str):
+        return self._caching.CachedContent.create(
+            model=model_name,
+            system_instruction=system_instruction,
+            ttl=datetime.timedelta(seconds=ttl_seconds),
+            display_name=display_name,
+        )
+
+    def extend(self, cache, ttl_seconds: int):
+        cache.update(ttl=datetime.timedelta(seconds=ttl_seconds))
+        return cache
+
+    def model_for(self, cache):
+        import google.generativeai as genai
+        return genai.GenerativeModel.from_cached_content(cached_content=cache, generation_config=self.generation_config)
+
+def _expires_at(cache) -> float:
+    return cache.expire_time.timestamp()
+
+class PromptCache:
+    """
+    Keeps a Gemini cached-content handle for the system prompt and hands out a
+    model bound to it.
+
+    The cache is keyed by a hash of the model and prompt (its display name), so
+    an existing handle is reused across restarts and a prompt change gets a new
+    one. The TTL is extended shortly before expiry. When caching is unavailable
+    (e.g. the prompt is below the minimum cacheable size) get_model returns the
+    fallback model built with system_instruction=....
+    """
+
+    def __init__(self, client, model_name: str, prompt: str, fallback_model,
+                 ttl_seconds: int = GEMINI_CONTEXT_CACHE_TTL,
+                 refresh_margin_seconds: int = GEMINI_CONTEXT_CACHE_REFRESH_MARGIN,
+                 retry_seconds: int = GEMINI_CONTEXT_CACHE_RETRY_SECONDS,
+                 clock=time.time):
+        self.client = client
+        self.model_name = model_name
+        self.prompt = prompt
+        self.fallback_model = fallback_model
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.retry_seconds = retry_seconds
+        self.clock = clock
+        self.display_name = "prompt-" + hashlib.sha256(f"{model_name}\n{prompt}".encode("utf-8")).hexdigest()[:16]
+        self._cache = None
+        self._model = None
+        self._retry_at = 0.0
+        self._looked_up = False
+        self._lock = threading.Lock()
+
+    def get_model(self):
+        """
+        Returns:
+            tuple: (model, cached) where cached says whether the model uses the cached prompt.
+        """
+        with self._lock:
+            now = self.clock()
+            if self._model is not None and now < _expires_at(self._cache) - self.refresh_margin_seconds:
+                return self._model, True
+            if now < self._retry_at:
+                return self.fallback_model, False
+            try:
+                self._refresh(now)
+                return self._model, True
+            except Exception as e:
+                print(f"Context cache unavailable, using uncached prompt: {e}")
+                self._cache = None
+                self._model = None
+                self._retry_at = now + self.retry_seconds
+                return self.fallback_model, False
+
+    def invalidate(self):
+        """
+        Drop the handle, e.g. after a request reports it missing; the next call recreates it.
+        """
+        with self._lock:
+            self._cache = None
+            self._model = None
+
+    def _refresh(self, now: float):
+        cache = self._cache
+        if cache is None and not self._looked_up:
+            self._looked_up = True
+            cache = self.client.find(self.display_name)
+
+        if cache is not None and _expires_at(cache) > now:
+            cache = self.client.extend(cache, self.ttl_seconds)
+            print(f"♻️ Extended context cache {self.display_name}")
+        else:
+            cache = self.client.create(self.model_name, self.prompt, self.ttl_seconds, self.display_name)
+            print(f"🆕 Created context cache {self.display_name}")
+
+        self._cache = cache
+        self._model = self.client.model_for(cache)
@@ -0,0 +1,191 @@
+import asyncio
+import collections
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Wall-clock budget for one run_analysis call; images not reached in time are
+# marked failed so the next run picks them up.
+ASSIGNMENT_DEADLINE_SECONDS = float(os.getenv("ASSIGNMENT_DEADLINE_SECONDS", "600"))
+IMAGE_FETCH_TIMEOUT = float(os.getenv("IMAGE_FETCH_TIMEOUT", "10"))
+MODEL_CALL_TIMEOUT = float(os.getenv("MODEL_CALL_TIMEOUT", "90"))
+
+# Hedging sends a duplicate request once the first has been outstanding for
+# longer than the observed p95 latency; the first to succeed wins.
+HEDGE_IMAGE_FETCHES = os.getenv("HEDGE_IMAGE_FETCHES", "true").lower() == "true"
+# Off by default: a hedged model call can be billed twice.
+HEDGE_MODEL_CALLS = os.getenv("HEDGE_MODEL_CALLS", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+# Samples needed before a tracker suggests a hedge delay at all.
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+# Never hedge sooner than this, however fast the p95 is.
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.2"))
+HEDGE_MAX_WORKERS = int(os.getenv("HEDGE_MAX_WORKERS", "16"))
+
+class DeadlineExceeded(RuntimeError):
+    """
+    Raised when a stage runs out of budget. A RuntimeError, so the per-image
+    failure handling in run_analysis records it like any other backend failure.
+    """
+
+class Deadline:
+    """
+    A fixed point in time that per-stage timeouts are carved out of.
+    """
+
+    def __init__(self, seconds: float, clock=time.monotonic):
+        self.clock = clock
+        self.expires_at = clock() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - self.clock())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout_for(self, cap: float) -> float:
+        """
+        Timeout for the next stage: the stage's own cap, or whatever is left of the budget if that is less.
+
+        Raises:
+            DeadlineExceeded: If the budget is already spent.
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded("deadline exceeded")
+        return min(cap, remaining)
+
+class LatencyTracker:
+    """
+    Rolling window of recent latencies (seconds) for one kind of request.
+    """
+
+    def __init__(self, window: int = 200, percentile: float = HEDGE_PERCENTILE,
+                 min_samples: int = HEDGE_MIN_SAMPLES, min_delay: float = HEDGE_MIN_DELAY):
+        self.samples = collections.deque(maxlen=window)
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def hedge_delay(self):
+        """
+        Returns:
+            float | None: Seconds to wait before hedging, or None while there are too few samples.
+        """
+        with self._lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(self.percentile * len(ordered)))
+        return max(self.min_delay, ordered[index])
+
+_hedge_pool = None
+_hedge_pool_lock = threading.Lock()
+
+def _get_hedge_pool():
+    global _hedge_pool
+    with _hedge_pool_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_MAX_WORKERS, thread_name_prefix="hedge")
+        return _hedge_pool
+
+def hedged_call(fn, hedge_after, timeout: float):
+    """
+    Run fn(cancel_event) and, if it has not finished after hedge_after seconds,
+    a second copy; return the first successful result.
+
+    The loser's cancel_event is set so cooperative work (e.g. a streamed
+    download) stops early. Work that cannot be interrupted, such as a blocking
+    model call, finishes in the background bounded by its own timeout.
+    hedge_after=None runs a single attempt with the same timeout handling.
+
+    Returns:
+        tuple: (result, hedged) where hedged says whether a second attempt was started.
+
+    Raises:
+        DeadlineExceeded: If no attempt succeeds within timeout.
+        Exception: The last attempt's error if every attempt failed.
+    """
+    pool = _get_hedge_pool()
+    expires_at = time.monotonic() + timeout
+    attempts = {}
+
+    def start():
+        cancel = threading.Event()
+        attempts[pool.submit(fn, cancel)] = cancel
+
+    start()
+    hedged = False
+    error = None
+    try:
+        while attempts:
+            remaining = expires_at - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"no result within {timeout:.1f}s")
+            wait_for = remaining if hedged or hedge_after is None else min(remaining, hedge_after)
+            done, _ = wait(list(attempts), timeout=wait_for, return_when=FIRST_COMPLETED)
+            if not done:
+                if not hedged and hedge_after is not None:
+                    hedged = True
+                    start()
+                continue
+            for future in done:
+                attempts.pop(future)
+                if future.exception() is None:
+                    return future.result(), hedged
+                error = future.exception()
+            # The only attempt failed before the hedge point; hedging would
+            # just repeat it, so report the failure.
+            if not attempts and not hedged:
+                break
+        raise error
+    finally:
+        for future, cancel in attempts.items():
+            cancel.set()
+            future.cancel()
+
+async def hedged_async(coro_factory, hedge_after, timeout: float):
+    """
+    Async counterpart of hedged_call: coro_factory() is awaited, and again after
+    hedge_after seconds if the first is still pending. Losing tasks are cancelled.
+
+    Returns:
+        tuple: (result, hedged)
+
+    Raises:
+        DeadlineExceeded: If no attempt succeeds within timeout.
+        Exception: The last attempt's error if every attempt failed.
+    """
+    loop = asyncio.get_running_loop()
+    expires_at = loop.time() + timeout
+    tasks = {asyncio.ensure_future(coro_factory())}
+    hedged = False
+    error = None
+    try:
+        while tasks:
+            remaining = expires_at - loop.time()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"no result within {timeout:.1f}s")
+            wait_for = remaining if hedged or hedge_after is None else min(remaining, hedge_after)
+            done, tasks = await asyncio.wait(tasks, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                if not hedged and hedge_after is not None:
+                    hedged = True
+                    tasks.add(asyncio.ensure_future(coro_factory()))
+                continue
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), hedged
+                error = task.exception()
+            if not tasks and not hedged:
+                break
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,163 @@
+import ast
+import json
+import re
+from typing import List, Optional, Union
+from pydantic import BaseModel, ConfigDict
+
+# Response schema handed to Gemini so it returns bare JSON in this shape
+# instead of free text.
+RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "objects": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "object": {"type": "STRING", "nullable": True},
+                    "label": {"type": "STRING", "nullable": True},
+                },
+            },
+        },
+        "chargeability_percentage": {"type": "NUMBER", "nullable": True},
+        "auditable": {"type": "STRING", "nullable": True},
+    },
+    "required": ["objects"],
+}
+
+# Upper bound on truncation points tried by repair_json.
+MAX_REPAIR_ATTEMPTS = 50
+
+class DetectedObject(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    object: Optional[str] = None
+    label: Optional[str] = None
+
+class DetectionResult(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    objects: List[DetectedObject] = []
+    chargeability_percentage: Optional[Union[int, float, str]] = None
+    auditable: Optional[Union[bool, str]] = None
+
+def strip_code_fences(text: str) -> str:
+    """
+    Remove a leading ```json / ``` fence and a trailing ``` fence, if present.
+    """
+    text = text.strip()
+    text = re.sub(r"^```[a-zA-Z]*\s*", "", text)
+    text = re.sub(r"\s*```$", "", text)
+    return text.strip()
+
+def repair_json(text: str) -> str:
+    """
+    Best-effort repair of fenced, chatty or truncated JSON object output.
+
+    Drops anything before the first '{' and after the matching '}'. If the
+    object is cut off, it is only cut back to the end of a fully closed array
+    element or top-level member, latest first, and the open containers are
+    closed. A half-written element, string or number is never kept.
+
+    Raises:
+        ValueError: If no parseable JSON object can be recovered.
+    """
+    return _repair(text)[0]
+
+def _repair(text: str):
+    # Returns (json_text, truncated); truncated is True when content had to be cut.
+    text = strip_code_fences(text)
+    start = text.find("{")
+    if start == -1:
+        raise ValueError("No JSON object found in model output.")
+    text = text[start:]
+
+    stack = []
+    cut_points = []
+    in_string = False
+    escape = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                return text[:i + 1], False
+            if _is_safe_cut(stack):
+                cut_points.append((i + 1, tuple(stack)))
+        elif ch == "," and _is_safe_cut(stack):
+            cut_points.append((i, tuple(stack)))
+
+    for end, open_containers in list(reversed(cut_points))[:MAX_REPAIR_ATTEMPTS]:
+        candidate = text[:end].rstrip().rstrip(",") + "".join(reversed(open_containers))
+        try:
+            json.loads(candidate)
+            return candidate, True
+        except ValueError:
+            continue
+    raise ValueError("Model output is not repairable JSON.")
+
+def _is_safe_cut(stack: list) -> bool:
+    # Everything before this point is complete if we are directly inside an
+    # array (the previous element is closed) or at the top level of the root
+    # object (the previous member is closed).
+    return stack[-1] == "]" or len(stack) == 1
+
+def parse_detection(text: str) -> dict:
+    """
+    Validate model output into a DetectionResult and return it as a plain dict.
+
+    The fast path validates the raw text directly; only on failure is the text
+    repaired and validated again. A result recovered from truncated output is
+    marked "repaired", as objects may have been dropped, and must not be
+    stored as current.
+
+    Raises:
+        ValueError: If the output cannot be parsed or does not match the schema.
+    """
+    try:
+        return DetectionResult.model_validate_json(text).model_dump()
+    except ValueError:
+        repaired, truncated = _repair(text)
+        if "objects" not in json.loads(repaired):
+            # Cut back past the start of the objects array; an empty list
+            # would read as an empty cooler.
+            raise ValueError("Repaired model output has no objects.")
+        result = DetectionResult.model_validate_json(repaired).model_dump()
+        if truncated:
+            result["repaired"] = True
+        return result
+
+def parse_detected_objects(raw):
+    """
+    Parse a stored detected_objects value back into a list of objects.
+
+    Handles the current JSON form, JSON wrapped in an extra pair of quotes,
+    and the Python-repr form written by older versions of run_analysis.
+    Returns None if the value cannot be parsed.
+    """
+    if raw is None:
+        return None
+    if isinstance(raw, list):
+        return raw
+    if raw.startswith('"') and raw.endswith('"'):
+        raw = raw[1:-1].replace('\\"', '"')
+    try:
+        objects = json.loads(raw)
+    except ValueError:
+        try:
+            objects = ast.literal_eval(raw)
+        except (ValueError, SyntaxError):
+            return None
+    return objects if isinstance(objects, list) else None
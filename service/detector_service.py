@@ -0,0 +1,265 @@
+import collections
+import hashlib
+import json
+import os
+import threading
+import time
+import numpy as np
+from PIL import Image
+from service.detection_schema import parse_detection
+from service.phash_service import dhash
+
+# Every backend returns the shape evaluate_cooler_smart expects:
+#   {"objects": [{"object": ..., "label": ...}, ...],
+#    "chargeability_percentage": ..., "auditable": ...}
+# plus "backend" and, where the backend can tell, a "confidence" in [0, 1].
+# A result marked "degraded" is a fallback that should be redone once the
+# preferred backend is available again; it is not stored as current.
+#
+# detect() also takes an optional stats dict that the backend fills with call
+# accounting (backend, model_name, input/output/cached token counts, retries,
+# cache_hit) for service/usage_service.record_model_call, and an optional
+# timeout in seconds that network-bound backends apply to the call.
+
+DETECTOR_BACKEND = os.getenv("DETECTOR_BACKEND", "gemini").lower()
+ONNX_MODEL_PATH = os.getenv("ONNX_MODEL_PATH")
+ONNX_LABELS_PATH = os.getenv("ONNX_LABELS_PATH")
+ONNX_INPUT_SIZE = int(os.getenv("ONNX_INPUT_SIZE", "640"))
+ONNX_SCORE_THRESHOLD = float(os.getenv("ONNX_SCORE_THRESHOLD", "0.25"))
+# Local results at or above this confidence are accepted without asking Gemini.
+CASCADE_CONFIDENCE_THRESHOLD = float(os.getenv("CASCADE_CONFIDENCE_THRESHOLD", "0.6"))
+# Rolling one-hour cap on escalations to the remote backend (0 = unlimited).
+CASCADE_MAX_REMOTE_CALLS_PER_HOUR = int(os.getenv("CASCADE_MAX_REMOTE_CALLS_PER_HOUR", "0"))
+
+class Detector:
+    """
+    Interface for object/brand detectors behind identify_objects_direct_from_file.
+
+    version identifies everything that affects the output (model, prompt,
+    weights) and becomes part of the stored ANALYSIS_VERSION.
+    """
+    name = "base"
+    version = "base"
+
+    def detect(self, image: Image.Image, stats: dict = None, timeout: float = None) -> dict:
+        """
+        Raises:
+            ValueError: If the backend output cannot be interpreted.
+            RuntimeError: If the backend itself fails.
+        """
+        raise NotImplementedError
+
+class GeminiDetector(Detector):
+    """
+    Gemini-backed detector. With a PromptCache the system prompt is sent as a
+    cached-content handle instead of with every request; if a cached call
+    fails, the handle is dropped and the call is retried uncached.
+    """
+    name = "gemini"
+
+    def __init__(self, model, version: str, prompt_cache=None, model_name: str = None):
+        self.model = model
+        self.version = version
+        self.prompt_cache = prompt_cache
+        self.model_name = model_name or version.split(":")[0]
+
+    def detect(self, image: Image.Image, stats: dict = None, timeout: float = None) -> dict:
+        stats = {} if stats is None else stats
+        model, cached = self.prompt_cache.get_model() if self.prompt_cache else (self.model, False)
+        stats.update(backend=self.name, model_name=self.model_name, cache_hit=cached, retries=0)
+        request_options = {"timeout": timeout} if timeout else None
+        try:
+            print("Started identifying objects and brands in the image.")
+            try:
+                response = model.generate_content([image], request_options=request_options)
+            except Exception as e:
+                if not cached:
+                    raise
+                print(f"Cached-prompt call failed, retrying uncached: {e}")
+                self.prompt_cache.invalidate()
+                stats.update(cache_hit=False, retries=stats["retries"] + 1)
+                response = self.model.generate_content([image], request_options=request_options)
+            print("Got Response!!")  # Debug output
+            usage = getattr(response, "usage_metadata", None)
+            if usage is not None:
+                stats.update(
+                    input_tokens=usage.prompt_token_count,
+                    output_tokens=usage.candidates_token_count,
+                    cached_tokens=getattr(usage, "cached_content_token_count", None),
+                )
+            response_text = response.text
+        except Exception as e:
+            raise RuntimeError(f"Gemini model failed: {e}")
+
+        try:
+            result = parse_detection(response_text)
+        except ValueError as e:
+            print(response_text)  # Debug output
+            raise ValueError(f"Failed to parse model output as JSON: {e}")
+        result["backend"] = self.name
+        return result
+
+class OnnxDetector(Detector):
+    """
+    Local CPU detector running an ONNX object-detection model via ONNX Runtime.
+
+    The model takes a 1x3xSxS float32 RGB tensor scaled to [0, 1] and returns
+    detections as rows of (x1, y1, x2, y2, score, class_id), as produced by
+    detectors exported with NMS included. The labels file is a JSON list indexed
+    by class_id whose entries are either a brand label or {"object", "label"}.
+    """
+    name = "onnx"
+
+    def __init__(self, model_path: str, labels_path: str, input_size: int = ONNX_INPUT_SIZE,
+                 score_threshold: float = ONNX_SCORE_THRESHOLD):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("The onnx detector backend requires onnxruntime to be installed.")
+        if not model_path or not labels_path:
+            raise RuntimeError("ONNX_MODEL_PATH and ONNX_LABELS_PATH must be set for the onnx detector backend.")
+
+        self.session = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        with open(labels_path, encoding="utf-8") as f:
+            self.labels = [
+                entry if isinstance(entry, dict) else {"object": "bottle", "label": entry}
+                for entry in json.load(f)
+            ]
+        self.input_size = input_size
+        self.score_threshold = score_threshold
+
+        with open(model_path, "rb") as f:
+            weights_hash = hashlib.sha256(f.read()).hexdigest()[:12]
+        self.version = f"onnx/{os.path.basename(model_path)}/{weights_hash}"
+
+    def detect(self, image: Image.Image, stats: dict = None, timeout: float = None) -> dict:
+        if stats is not None:
+            stats.update(backend=self.name, model_name=self.version)
+        size = self.input_size
+        rgb = image.convert("RGB").resize((size, size))
+        tensor = (np.asarray(rgb, dtype=np.float32) / 255.0).transpose(2, 0, 1)[None]
+        try:
+            output = np.asarray(self.session.run(None, {self.input_name: tensor})[0])
+        except Exception as e:
+            raise RuntimeError(f"ONNX model failed: {e}")
+        if output.shape[-1] < 6:
+            raise ValueError(f"Unexpected ONNX output shape {output.shape}; expected rows of 6 values.")
+
+        detections = output.reshape(-1, output.shape[-1])[:, :6]
+        detections = detections[detections[:, 4] >= self.score_threshold]
+
+        objects = []
+        covered = 0.0
+        for x1, y1, x2, y2, score, class_id in detections:
+            class_id = int(class_id)
+            entry = self.labels[class_id] if 0 <= class_id < len(self.labels) else {"object": "unknown", "label": None}
+            objects.append({"object": entry.get("object"), "label": entry.get("label"), "score": round(float(score), 3)})
+            covered += max(0.0, float(x2 - x1)) * max(0.0, float(y2 - y1))
+
+        # Coarse chargeability: share of the frame covered by detected products.
+        chargeability = round(min(1.0, covered / float(size * size)) * 100)
+        return {
+            "objects": objects,
+            "chargeability_percentage": chargeability,
+            "auditable": "Yes" if objects else "No",
+            "confidence": float(detections[:, 4].min()) if len(detections) else 0.0,
+            "backend": self.name,
+        }
+
+class FakeDetector(Detector):
+    """
+    Deterministic detector for tests and local development: the same image
+    always yields the same result, derived from its perceptual hash.
+    """
+    name = "fake"
+    version = "fake/1"
+    LABELS = ["Coca-Cola Original", "Sprite", "Fanta", "Pepsi", "Red Bull", "Dasani"]
+
+    def detect(self, image: Image.Image, stats: dict = None, timeout: float = None) -> dict:
+        if stats is not None:
+            stats.update(backend=self.name, model_name=self.version)
+        value = dhash(image)
+        count = value % 5
+        objects = [
+            {"object": "bottle", "label": self.LABELS[(value >> (8 * i)) % len(self.LABELS)]}
+            for i in range(count)
+        ]
+        return {
+            "objects": objects,
+            "chargeability_percentage": (value >> 40) % 101,
+            "auditable": "Yes",
+            "confidence": 1.0,
+            "backend": self.name,
+        }
+
+class CascadeDetector(Detector):
+    """
+    Run the local detector first and escalate to the remote one only when the
+    local result is missing or below the confidence threshold.
+
+    If the remote call fails or the hourly remote budget is spent, the local
+    result is used when there is one, so analysis keeps working through outages.
+    Such a below-threshold result is marked degraded so it is re-escalated later.
+    """
+    name = "cascade"
+
+    def __init__(self, local: Detector, remote: Detector, threshold: float = CASCADE_CONFIDENCE_THRESHOLD,
+                 max_remote_calls_per_hour: int = CASCADE_MAX_REMOTE_CALLS_PER_HOUR):
+        self.local = local
+        self.remote = remote
+        self.threshold = threshold
+        self.max_remote_calls_per_hour = max_remote_calls_per_hour
+        self.version = f"cascade({local.version}|{remote.version}@{threshold})"
+        self._remote_calls = collections.deque()
+        self._lock = threading.Lock()
+
+    def _take_remote_budget(self) -> bool:
+        if not self.max_remote_calls_per_hour:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            while self._remote_calls and now - self._remote_calls[0] > 3600:
+                self._remote_calls.popleft()
+            if len(self._remote_calls) >= self.max_remote_calls_per_hour:
+                return False
+            self._remote_calls.append(now)
+            return True
+
+    def detect(self, image: Image.Image, stats: dict = None, timeout: float = None) -> dict:
+        local_result = None
+        try:
+            local_result = self.local.detect(image, stats)
+        except (ValueError, RuntimeError) as e:
+            print(f"Local detector failed, escalating: {e}")
+
+        if local_result is not None and local_result.get("confidence", 0.0) >= self.threshold:
+            return local_result
+
+        if not self._take_remote_budget():
+            if local_result is not None:
+                print("Remote detector budget exhausted, using local result")
+                return dict(local_result, degraded=True)
+            raise RuntimeError("Remote detector budget exhausted and local detector failed.")
+
+        try:
+            return self.remote.detect(image, stats, timeout)
+        except (ValueError, RuntimeError) as e:
+            if local_result is not None:
+                print(f"Remote detector failed, using local result: {e}")
+                return dict(local_result, degraded=True)
+            raise
+
+def build_detector(backend: str, gemini: Detector = None) -> Detector:
+    """
+    Build the detector for a DETECTOR_BACKEND value: gemini, onnx, fake or cascade.
+    """
+    if backend == "gemini":
+        return gemini
+    if backend == "onnx":
+        return OnnxDetector(ONNX_MODEL_PATH, ONNX_LABELS_PATH)
+    if backend == "fake":
+        return FakeDetector()
+    if backend == "cascade":
+        return CascadeDetector(OnnxDetector(ONNX_MODEL_PATH, ONNX_LABELS_PATH), gemini)
+    raise EnvironmentError(f"Unknown DETECTOR_BACKEND '{backend}'.")
@@ -0,0 +1,147 @@
+import csv
+import io
+import os
+import uuid
+from database import connect_for_read
+from service.streaming import ChunkBuffer
+
+# Rows fetched per round trip from the server-side cursor; memory per export
+# stays proportional to this, not to the size of the result.
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+
+# (column, parquet type) in output order.
+EXPORT_COLUMNS = [
+    ("assignment_id", "int64"),
+    ("assigned_visit_date", "date"),
+    ("actual_visit_date", "timestamp"),
+    ("assignment_status", "string"),
+    ("store_id", "int64"),
+    ("store_name", "string"),
+    ("user_id", "int64"),
+    ("employee_name", "string"),
+    ("manager_name", "string"),
+    ("image_id", "int64"),
+    ("image_url", "string"),
+    ("upload_time", "timestamp"),
+    ("image_status", "string"),
+    ("found_sga_photo", "string"),
+    ("auditable_photo", "string"),
+    ("purity", "string"),
+    ("chargeability", "string"),
+    ("abused", "string"),
+    ("emptyy", "string"),
+    ("detected_objects", "string"),
+    ("analysis_version", "string"),
+]
+
+EXPORT_QUERY = """
+    SELECT
+        sa.assignment_id,
+        sa.assigned_visit_date,
+        sa.actual_visit_date,
+        sa.status AS assignment_status,
+        s.store_id,
+        s.store_name,
+        u.user_id,
+        u.username AS employee_name,
+        m.username AS manager_name,
+        sai.image_id,
+        sai.image_url,
+        sai.upload_time,
+        sai.status AS image_status,
+        sai.found_sga_photo,
+        sai.auditable_photo,
+        sai.purity,
+        sai.chargeability,
+        sai.abused,
+        sai.emptyy,
+        sai.detected_objects,
+        sai.analysis_version
+    FROM public.storeassignmentimages sai
+    JOIN public.storeassignments sa ON sai.assignment_id = sa.assignment_id
+    JOIN public.stores s ON sa.store_id = s.store_id
+    JOIN public.users u ON sa.user_id = u.user_id
+    JOIN public.users m ON sa.assigned_by = m.user_id
+    WHERE (%(manager_id)s IS NULL OR sa.assigned_by = %(manager_id)s)
+      AND (%(store_id)s IS NULL OR sa.store_id = %(store_id)s)
+      AND (%(date_from)s::date IS NULL OR sa.assigned_visit_date >= %(date_from)s::date)
+      AND (%(date_to)s::date IS NULL OR sa.assigned_visit_date <= %(date_to)s::date)
+    ORDER BY sai.image_id
+"""
+
+def iter_export_batches(filters: dict, batch_size: int = EXPORT_BATCH_SIZE):
+    """
+    Yield lists of result rows (tuples in EXPORT_COLUMNS order) from a named,
+    server-side cursor, batch_size rows at a time.
+    """
+    conn = None
+    try:
+        _, conn = connect_for_read()
+        with conn.cursor(name=f"export_{uuid.uuid4().hex}") as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(EXPORT_QUERY, filters)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+    finally:
+        if conn:
+            conn.rollback()
+            conn.close()
+
+def stream_csv(filters: dict):
+    """
+    Stream the export as UTF-8 CSV, one chunk per batch.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in EXPORT_COLUMNS])
+    yield buffer.getvalue().encode("utf-8")
+
+    for rows in iter_export_batches(filters):
+        buffer.seek(0)
+        buffer.truncate(0)
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def stream_parquet(filters: dict):
+    """
+    Stream the export as Parquet, one row group per batch.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    arrow_types = {
+        "int64": pa.int64(),
+        "date": pa.date32(),
+        "timestamp": pa.timestamp("us", tz="UTC"),
+        "string": pa.string(),
+    }
+    schema = pa.schema([(name, arrow_types[kind]) for name, kind in EXPORT_COLUMNS])
+    string_columns = {i for i, (_, kind) in enumerate(EXPORT_COLUMNS) if kind == "string"}
+
+    buffer = ChunkBuffer()
+    writer = pq.ParquetWriter(buffer, schema)
+    try:
+        for rows in iter_export_batches(filters):
+            columns = list(zip(*rows))
+            arrays = [
+                pa.array(
+                    [None if v is None else str(v) for v in values] if i in string_columns else list(values),
+                    type=schema.field(i).type
+                )
+                for i, values in enumerate(columns)
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield buffer.drain()
+    finally:
+        writer.close()
+    yield buffer.drain()
@@ -0,0 +1,97 @@
+import os
+from PIL import Image
+
+# Maximum Hamming distance (out of 64 bits) for two photos to count as near-duplicates.
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", "6"))
+# Hashes with fewer set (or unset) bits than this come from blank, black or
+# flat frames, which all hash to about the same value; they are never matched.
+PHASH_MIN_BITS = int(os.getenv("PHASH_MIN_BITS", "8"))
+
+def dhash(img: Image.Image, hash_size: int = 8) -> int:
+    """
+    Compute a difference hash (dHash) of an image.
+
+    The image is reduced to a (hash_size + 1) x hash_size grayscale thumbnail and
+    each bit records whether a pixel is brighter than its right-hand neighbour,
+    so re-encodes, resizes and small exposure changes map to nearby hashes.
+
+    Args:
+        img (PIL.Image.Image): Image to hash.
+        hash_size (int): Side of the hash grid; 8 gives a 64-bit hash.
+
+    Returns:
+        int: The hash as an unsigned integer.
+    """
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def hash_to_hex(value: int) -> str:
+    return f"{value:016x}"
+
+def hex_to_hash(value: str) -> int:
+    return int(value, 16)
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def is_distinctive(value: int, bits: int = 64) -> bool:
+    """
+    Whether a hash carries enough structure to be compared with others.
+    """
+    ones = bin(value).count("1")
+    return PHASH_MIN_BITS <= ones <= bits - PHASH_MIN_BITS
+
+class BKTree:
+    """
+    Burkhard-Keller tree over Hamming distance for near-duplicate hash lookups.
+
+    Each node stores a hash, its payload and children keyed by their distance to
+    the node, which lets a radius search prune every subtree outside
+    [d - max_distance, d + max_distance].
+    """
+
+    def __init__(self):
+        self._root = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, value: int, item):
+        node = [value, item, {}]
+        self._size += 1
+        if self._root is None:
+            self._root = node
+            return
+        current = self._root
+        while True:
+            distance = hamming_distance(value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, value: int, max_distance: int = PHASH_MAX_DISTANCE) -> list:
+        """
+        Return (distance, item) pairs within max_distance, closest first.
+        """
+        if self._root is None:
+            return []
+        matches = []
+        stack = [self._root]
+        while stack:
+            node_value, item, children = stack.pop()
+            distance = hamming_distance(value, node_value)
+            if distance <= max_distance:
+                matches.append((distance, item))
+            low, high = distance - max_distance, distance + max_distance
+            stack.extend(child for d, child in children.items() if low <= d <= high)
+        matches.sort(key=lambda m: m[0])
+        return matches
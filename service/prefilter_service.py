@@ -0,0 +1,91 @@
+import hashlib
+import os
+import numpy as np
+from PIL import Image
+
+# Long side (px) of the grayscale copy the metrics are computed on.
+PREFILTER_SIZE = int(os.getenv("PREFILTER_SIZE", "256"))
+# off: never run. shadow: compute the metrics and log what would be rejected,
+# but analyse everything. enforce: reject without calling the detector.
+# Only switch to enforce once the thresholds have been calibrated against real
+# store photos (scripts/calibrate_prefilter.py).
+PREFILTER_MODE = os.getenv("PREFILTER_MODE", "shadow").lower()
+if PREFILTER_MODE not in ("off", "shadow", "enforce"):
+    raise ValueError(f"PREFILTER_MODE must be off, shadow or enforce, not {PREFILTER_MODE!r}.")
+# Variance of the Laplacian below which the photo is considered too blurry.
+PREFILTER_BLUR_THRESHOLD = float(os.getenv("PREFILTER_BLUR_THRESHOLD", "40"))
+# Mean brightness (0-255) outside [dark, bright] is considered badly exposed.
+PREFILTER_DARK_THRESHOLD = float(os.getenv("PREFILTER_DARK_THRESHOLD", "35"))
+PREFILTER_BRIGHT_THRESHOLD = float(os.getenv("PREFILTER_BRIGHT_THRESHOLD", "225"))
+# Fraction of pixels with a strong gradient below which the frame is treated as
+# featureless (a wall, a closed door, a pocket shot) rather than a stocked cooler.
+PREFILTER_MIN_EDGE_DENSITY = float(os.getenv("PREFILTER_MIN_EDGE_DENSITY", "0.02"))
+PREFILTER_EDGE_MAGNITUDE = float(os.getenv("PREFILTER_EDGE_MAGNITUDE", "30"))
+# Bump when the metrics or decision logic below change.
+PREFILTER_RULES_VERSION = "1"
+
+# Stored with rejected images, so a recalibration (or disabling the filter)
+# makes earlier rejections eligible for analysis again.
+PREFILTER_VERSION = hashlib.sha256("|".join(str(value) for value in (
+    PREFILTER_RULES_VERSION, PREFILTER_MODE, PREFILTER_SIZE, PREFILTER_BLUR_THRESHOLD, PREFILTER_DARK_THRESHOLD,
+    PREFILTER_BRIGHT_THRESHOLD, PREFILTER_MIN_EDGE_DENSITY, PREFILTER_EDGE_MAGNITUDE,
+)).encode("utf-8")).hexdigest()[:12]
+
+def image_metrics(img: Image.Image) -> dict:
+    """
+    Compute cheap quality metrics on a downscaled grayscale copy of the image.
+
+    Returns:
+        dict: blur (Laplacian variance), brightness (mean 0-255) and
+        edge_density (fraction of pixels with a strong gradient).
+    """
+    small = img.convert("L")
+    small.thumbnail((PREFILTER_SIZE, PREFILTER_SIZE))
+    gray = np.asarray(small, dtype=np.float32)
+
+    laplacian = (
+        gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+        - 4.0 * gray[1:-1, 1:-1]
+    )
+    gx = gray[1:-1, 2:] - gray[1:-1, :-2]
+    gy = gray[2:, 1:-1] - gray[:-2, 1:-1]
+    magnitude = np.hypot(gx, gy)
+
+    return {
+        "blur": float(laplacian.var()),
+        "brightness": float(gray.mean()),
+        "edge_density": float((magnitude > PREFILTER_EDGE_MAGNITUDE).mean()),
+    }
+
+def rejection_reason(metrics: dict):
+    """
+    Return why metrics fall outside the thresholds, or None if they pass.
+    """
+    if metrics["brightness"] < PREFILTER_DARK_THRESHOLD:
+        return f"too dark (brightness={metrics['brightness']:.1f})"
+    if metrics["brightness"] > PREFILTER_BRIGHT_THRESHOLD:
+        return f"overexposed (brightness={metrics['brightness']:.1f})"
+    if metrics["blur"] < PREFILTER_BLUR_THRESHOLD:
+        return f"too blurry (laplacian variance={metrics['blur']:.1f})"
+    if metrics["edge_density"] < PREFILTER_MIN_EDGE_DENSITY:
+        return f"no cooler content (edge density={metrics['edge_density']:.3f})"
+    return None
+
+def prefilter_image(img: Image.Image):
+    """
+    Decide whether a photo is worth sending to the detector. Only rejects in
+    PREFILTER_MODE=enforce; in shadow mode the would-be rejection is logged.
+
+    Returns:
+        tuple: (ok, reason, metrics); reason is None when ok is True.
+    """
+    if PREFILTER_MODE == "off":
+        return True, None, {}
+    metrics = image_metrics(img)
+    reason = rejection_reason(metrics)
+    if reason is None:
+        return True, None, metrics
+    if PREFILTER_MODE == "shadow":
+        print(f"   👀 Pre-filter would reject: {reason}")
+        return True, None, metrics
+    return False, reason, metrics
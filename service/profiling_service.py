@@ -0,0 +1,215 @@
+import collections
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+# Hard ceiling on how long a profile or memory trace may run before it stops itself.
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "300"))
+
+class SamplingProfiler:
+    """
+    Time-boxed statistical profiler covering every thread in the process.
+
+    A daemon thread snapshots sys._current_frames() every interval and counts,
+    per function, how often it was on top of a stack (self) and anywhere on a
+    stack (cumulative). Unlike cProfile, this sees the worker threads running
+    background tasks and threadpool routes, and its overhead is bounded by the
+    sampling rate.
+    """
+
+    def __init__(self, duration: float, interval: float = 0.005):
+        self.duration = min(duration, PROFILE_MAX_SECONDS)
+        self.interval = interval
+        self.samples = 0
+        self.started_at = None
+        self.stopped_at = None
+        self._self_counts = collections.Counter()
+        self._total_counts = collections.Counter()
+        # Guards the counters, which report() reads while _run is sampling.
+        self._counts_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + self.duration
+        while not self._stop_event.is_set() and time.monotonic() < deadline:
+            tops = []
+            seen_per_thread = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                seen = set()
+                top = True
+                while frame is not None:
+                    code = frame.f_code
+                    key = (code.co_filename, code.co_firstlineno, code.co_name)
+                    if top:
+                        tops.append(key)
+                        top = False
+                    seen.add(key)
+                    frame = frame.f_back
+                seen_per_thread.append(seen)
+            with self._counts_lock:
+                self._self_counts.update(tops)
+                for seen in seen_per_thread:
+                    self._total_counts.update(seen)
+                self.samples += 1
+            self._stop_event.wait(self.interval)
+        self.stopped_at = time.time()
+
+    def report(self, limit: int = 30) -> dict:
+        with self._counts_lock:
+            samples = self.samples
+            self_counts = self._self_counts.copy()
+            total_counts = self._total_counts.copy()
+
+        def rows(counter):
+            return [
+                {
+                    "function": name,
+                    "location": f"{filename}:{lineno}",
+                    "samples": count,
+                    "percent": round(100.0 * count / samples, 2) if samples else 0.0,
+                }
+                for (filename, lineno, name), count in counter.most_common(limit)
+            ]
+
+        return {
+            "running": self.running,
+            "samples": samples,
+            "interval_seconds": self.interval,
+            "started_at": self.started_at,
+            "stopped_at": self.stopped_at,
+            "top_self": rows(self_counts),
+            "top_cumulative": rows(total_counts),
+        }
+
+class MemoryTracer:
+    """
+    Time-boxed tracemalloc session that reports allocation growth since start.
+    """
+
+    def __init__(self, duration: float, frames: int = 10):
+        self.duration = min(duration, PROFILE_MAX_SECONDS)
+        self.frames = frames
+        self.started_at = None
+        self._baseline = None
+        self._final = None
+        self._timer = None
+        # Serialises the Timer-driven stop() with report()'s snapshot.
+        self._state_lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return tracemalloc.is_tracing() and self._final is None
+
+    def start(self):
+        tracemalloc.start(self.frames)
+        self._baseline = tracemalloc.take_snapshot()
+        self.started_at = time.time()
+        self._timer = threading.Timer(self.duration, self.stop)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def stop(self):
+        if self._timer:
+            self._timer.cancel()
+        with self._state_lock:
+            if self._final is None and tracemalloc.is_tracing():
+                self._final = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+
+    def report(self, limit: int = 30, group_by: str = "lineno") -> dict:
+        with self._state_lock:
+            snapshot = self._final or (tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None)
+            current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (None, None)
+            running = self.running
+        if snapshot is None or self._baseline is None:
+            return {"running": False, "top_allocations": []}
+
+        ignore = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ]
+        snapshot = snapshot.filter_traces(ignore)
+        stats = snapshot.compare_to(self._baseline.filter_traces(ignore), group_by)
+        return {
+            "running": running,
+            "started_at": self.started_at,
+            "traced_current_bytes": current,
+            "traced_peak_bytes": peak,
+            "top_allocations": [
+                {
+                    "location": str(stat.traceback[0]) if stat.traceback else None,
+                    "traceback": [str(frame) for frame in stat.traceback],
+                    "size_bytes": stat.size,
+                    "size_diff_bytes": stat.size_diff,
+                    "count": stat.count,
+                    "count_diff": stat.count_diff,
+                }
+                for stat in stats[:limit]
+            ],
+        }
+
+_lock = threading.Lock()
+_profiler = None
+_tracer = None
+
+def start_profile(duration: float, interval: float) -> SamplingProfiler:
+    global _profiler
+    with _lock:
+        if _profiler is not None and _profiler.running:
+            raise RuntimeError("A profile is already running.")
+        _profiler = SamplingProfiler(duration, interval)
+        _profiler.start()
+        return _profiler
+
+def stop_profile(limit: int) -> dict:
+    with _lock:
+        if _profiler is None:
+            raise LookupError("No profile has been started.")
+        _profiler.stop()
+        return _profiler.report(limit)
+
+def profile_report(limit: int) -> dict:
+    if _profiler is None:
+        raise LookupError("No profile has been started.")
+    return _profiler.report(limit)
+
+def start_memory_trace(duration: float, frames: int) -> MemoryTracer:
+    global _tracer
+    with _lock:
+        if tracemalloc.is_tracing():
+            raise RuntimeError("Memory tracing is already running.")
+        _tracer = MemoryTracer(duration, frames)
+        _tracer.start()
+        return _tracer
+
+def memory_report(limit: int, group_by: str) -> dict:
+    with _lock:
+        if _tracer is None:
+            raise LookupError("No memory trace has been started.")
+        return _tracer.report(limit, group_by)
+
+def stop_memory_trace(limit: int, group_by: str) -> dict:
+    with _lock:
+        if _tracer is None:
+            raise LookupError("No memory trace has been started.")
+        _tracer.stop()
+        return _tracer.report(limit, group_by)
@@ -0,0 +1,155 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from dotenv import load_dotenv, find_dotenv
+from database import NotificationListener, connect_to_db
+
+load_dotenv(find_dotenv())
+
+# Also relay progress through Postgres NOTIFY so clients connected to another
+# worker process see it. Not needed with a single worker.
+ANALYSIS_PROGRESS_NOTIFY = os.getenv("ANALYSIS_PROGRESS_NOTIFY", "false").lower() == "true"
+PROGRESS_CHANNEL = "analysis_progress"
+# Events buffered per subscriber; a client that falls further behind loses the oldest.
+PROGRESS_QUEUE_SIZE = int(os.getenv("PROGRESS_QUEUE_SIZE", "256"))
+PROGRESS_HEARTBEAT_SECONDS = float(os.getenv("PROGRESS_HEARTBEAT_SECONDS", "15"))
+
+# Identifies this process in relayed events.
+_ORIGIN = uuid.uuid4().hex
+
+class ProgressSubscription:
+    """
+    One client's view of the bus: an asyncio queue fed from any thread,
+    optionally filtered to one manager or one assignment.
+    """
+
+    def __init__(self, loop, manager_id: int = None, assignment_id: int = None, maxsize: int = PROGRESS_QUEUE_SIZE):
+        self.loop = loop
+        self.manager_id = manager_id
+        self.assignment_id = assignment_id
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def wants(self, event: dict) -> bool:
+        if self.manager_id is not None and event.get("manager_id") != self.manager_id:
+            return False
+        if self.assignment_id is not None and event.get("assignment_id") != self.assignment_id:
+            return False
+        return True
+
+    def _put(self, event: dict):
+        # Runs on the subscriber's event loop.
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    def deliver(self, event: dict):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # The subscriber's loop is closed; it will be unsubscribed on its way out.
+            pass
+
+class ProgressBus:
+    """
+    In-process fan-out of analysis progress events from worker threads to
+    async subscribers.
+    """
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, manager_id: int = None, assignment_id: int = None) -> ProgressSubscription:
+        """
+        Must be called from the event loop that will consume the subscription.
+        """
+        subscription = ProgressSubscription(asyncio.get_running_loop(), manager_id, assignment_id)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: ProgressSubscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def dispatch(self, event: dict):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            if subscription.wants(event):
+                subscription.deliver(event)
+
+progress_bus = ProgressBus()
+
+def _notify(event: dict):
+    connection = None
+    try:
+        curr, connection = connect_to_db()
+        cursor = connection.cursor()
+        cursor.execute("SELECT pg_notify(%s, %s);", (PROGRESS_CHANNEL, json.dumps(dict(event, origin=_ORIGIN), default=str)))
+        connection.commit()
+    except Exception as e:
+        print(f"Error relaying progress event: {e}")
+    finally:
+        if connection:
+            connection.close()
+
+def publish_progress(event_type: str, assignment_id: int, manager_id: int = None, **fields):
+    """
+    Publish a progress event (started, image_done, completed or failed) for an
+    assignment. Safe to call from any thread; never raises into the analysis.
+    """
+    event = {"event": event_type, "assignment_id": assignment_id, "manager_id": manager_id, "ts": time.time(), **fields}
+    progress_bus.dispatch(event)
+    if ANALYSIS_PROGRESS_NOTIFY:
+        _notify(event)
+
+def _handle_progress_notify(payload: str):
+    event = json.loads(payload)
+    # Events from this process were already dispatched locally.
+    if event.pop("origin", None) != _ORIGIN:
+        progress_bus.dispatch(event)
+
+def format_sse(event: dict) -> str:
+    return f"event: {event['event']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+async def stream_progress(request, manager_id: int = None, assignment_id: int = None):
+    """
+    Server-Sent Events stream of progress events for one manager or
+    assignment, with a comment line every PROGRESS_HEARTBEAT_SECONDS so
+    proxies keep the connection open and disconnects are noticed.
+    """
+    subscription = progress_bus.subscribe(manager_id, assignment_id)
+    try:
+        yield "retry: 3000\n\n"
+        while not await request.is_disconnected():
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), timeout=PROGRESS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield format_sse(event)
+    finally:
+        progress_bus.unsubscribe(subscription)
+
+_listener = None
+
+def start_progress_listener():
+    """
+    Start the LISTEN thread that relays other workers' progress events.
+    Only needed with ANALYSIS_PROGRESS_NOTIFY.
+    """
+    global _listener
+    if not ANALYSIS_PROGRESS_NOTIFY or _listener is not None:
+        return
+    _listener = NotificationListener({PROGRESS_CHANNEL: _handle_progress_notify})
+    _listener.start()
+
+def stop_progress_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
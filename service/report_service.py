@@ -1,5 +1,7 @@
 from io import BytesIO
-import json, ast, requests
+import os, requests, shutil, tempfile, zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, PageBreak
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet
@@ -7,12 +9,37 @@ from reportlab.lib import colors
 
 import asyncio
 import aiohttp
-
-from database import connect_to_db
-def fetch_assignment_data(assignment_id):
-    query = """
+from PIL import Image as PILImage
+
+from database import connect_for_read
+from service.deadline_service import HEDGE_IMAGE_FETCHES, Deadline, LatencyTracker, hedged_async
+from service.detection_schema import parse_detected_objects
+from service.streaming import ChunkBuffer
+
+# Worker processes used to render PDFs for bulk exports (defaults to one per CPU).
+REPORT_PROCESS_WORKERS = int(os.getenv("REPORT_PROCESS_WORKERS", "0")) or None
+# Upper bound on how many assignments a single bulk export may include.
+BULK_REPORT_MAX_ASSIGNMENTS = int(os.getenv("BULK_REPORT_MAX_ASSIGNMENTS", "500"))
+# Stores whose images are downloaded and reports rendered at the same time in
+# a bulk export; bounds how many stores' images are held in memory.
+BULK_REPORT_STORES_IN_FLIGHT = int(os.getenv("BULK_REPORT_STORES_IN_FLIGHT", "4"))
+REPORT_IMAGE_TIMEOUT = float(os.getenv("REPORT_IMAGE_TIMEOUT", "10"))
+# Budget for downloading all images of one report (or one store in a bulk export);
+# images still missing then are rendered as unavailable.
+REPORT_IMAGE_DEADLINE_SECONDS = float(os.getenv("REPORT_IMAGE_DEADLINE_SECONDS", "60"))
+REPORT_FETCH_LATENCY = LatencyTracker()
+# Single reports: the PDF is spooled in memory up to this size, then on disk.
+REPORT_SPOOL_MAX_BYTES = int(os.getenv("REPORT_SPOOL_MAX_BYTES", str(8 * 1024 * 1024)))
+# Photos are downscaled to this many pixels on the long side before embedding.
+REPORT_IMAGE_MAX_PX = int(os.getenv("REPORT_IMAGE_MAX_PX", "800"))
+# Concurrent image downloads for one single-assignment report.
+REPORT_FETCH_CONCURRENCY = int(os.getenv("REPORT_FETCH_CONCURRENCY", "8"))
+REPORT_STREAM_CHUNK_SIZE = 64 * 1024
+
+REPORT_SELECT = """
     SELECT
         sa.assignment_id,
+        sa.store_id,
         sa.assigned_visit_date,
         sa.actual_visit_date,
         sa.status AS assignment_status,
@@ -30,24 +57,91 @@ def fetch_assignment_data(assignment_id):
         sai.chargeability,
         sai.abused,
         sai.emptyy,
-        sai.detected_objects
+        sai.detected_objects,
+        sas.image_count,
+        sas.analysed_count,
+        sas.pure_count,
+        sas.abused_count,
+        sas.empty_count,
+        sas.avg_chargeability,
+        sas.detected_brands,
+        sas.last_analysed_at
     FROM public.storeassignments sa
     JOIN public.stores s ON sa.store_id = s.store_id
     JOIN public.users u ON sa.user_id = u.user_id
     JOIN public.users m ON sa.assigned_by = m.user_id
+    LEFT JOIN public.storeassignment_summary sas ON sa.assignment_id = sas.assignment_id
     LEFT JOIN public.storeassignmentimages sai ON sa.assignment_id = sai.assignment_id
+"""
+
+FETCH_ASSIGNMENT_QUERY = REPORT_SELECT + """
     WHERE sa.assignment_id = %(assignment_id)s
     ORDER BY sai.upload_time;
-    """
-    _, conn = connect_to_db()
-    cur = conn.cursor()
-    cur.execute(query, {'assignment_id': assignment_id})
-    rows = cur.fetchall()
-    colnames = [desc[0] for desc in cur.description]
-    cur.close()
-    conn.close()
+"""
+
+FETCH_ASSIGNMENTS_QUERY = REPORT_SELECT + """
+    WHERE sa.assignment_id = ANY(%(assignment_ids)s)
+    ORDER BY sa.assignment_id, sai.upload_time;
+"""
+
+ASSIGNMENT_IDS_QUERY = """
+    SELECT sa.assignment_id
+    FROM public.storeassignments sa
+    WHERE (%(manager_id)s IS NULL OR sa.assigned_by = %(manager_id)s)
+      AND (%(store_id)s IS NULL OR sa.store_id = %(store_id)s)
+      AND (%(date_from)s::date IS NULL OR sa.assigned_visit_date >= %(date_from)s::date)
+      AND (%(date_to)s::date IS NULL OR sa.assigned_visit_date <= %(date_to)s::date)
+    ORDER BY sa.store_id, sa.assignment_id;
+"""
+
+def fetch_assignment_data(assignment_id):
+    conn = None
+    try:
+        _, conn = connect_for_read()
+        with conn.cursor() as cur:
+            cur.execute(FETCH_ASSIGNMENT_QUERY, {'assignment_id': assignment_id})
+            rows = cur.fetchall()
+            colnames = [desc[0] for desc in cur.description]
+    finally:
+        if conn:
+            conn.close()
     return [dict(zip(colnames, row)) for row in rows]
 
+def fetch_assignments_data(assignment_ids):
+    """
+    Fetch report rows for many assignments in one query, grouped by assignment_id.
+    """
+    conn = None
+    try:
+        _, conn = connect_for_read()
+        with conn.cursor() as cur:
+            cur.execute(FETCH_ASSIGNMENTS_QUERY, {'assignment_ids': list(assignment_ids)})
+            rows = cur.fetchall()
+            colnames = [desc[0] for desc in cur.description]
+    finally:
+        if conn:
+            conn.close()
+    grouped = {}
+    for row in rows:
+        record = dict(zip(colnames, row))
+        grouped.setdefault(record['assignment_id'], []).append(record)
+    return grouped
+
+def fetch_assignment_ids(manager_id=None, store_id=None, date_from=None, date_to=None):
+    """
+    Return the assignment IDs matching the bulk export filter, ordered by store.
+    Dates filter on assigned_visit_date (inclusive).
+    """
+    conn = None
+    try:
+        _, conn = connect_for_read()
+        with conn.cursor() as cur:
+            cur.execute(ASSIGNMENT_IDS_QUERY, {'manager_id': manager_id, 'store_id': store_id, 'date_from': date_from, 'date_to': date_to})
+            return [row[0] for row in cur.fetchall()]
+    finally:
+        if conn:
+            conn.close()
+
 # def create_pdf_report(assignment_id) -> bytes:
 #     data = fetch_assignment_data(assignment_id)
 #     if not data:
@@ -136,29 +230,149 @@ def fetch_assignment_data(assignment_id):
 #     buffer.seek(0)
 #     return buffer.getvalue()
 
-async def fetch_image(session, url):
+async def _download(session, url, timeout):
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+        resp.raise_for_status()
+        body = await resp.read()
+    REPORT_FETCH_LATENCY.record(loop.time() - started)
+    return body
+
+async def fetch_image(session, url, deadline: Deadline = None):
     try:
-        async with session.get(url, timeout=10) as resp:
-            if resp.status == 200:
-                return await resp.read()
+        timeout = deadline.timeout_for(REPORT_IMAGE_TIMEOUT) if deadline else REPORT_IMAGE_TIMEOUT
+        hedge_after = REPORT_FETCH_LATENCY.hedge_delay() if HEDGE_IMAGE_FETCHES else None
+        body, _ = await hedged_async(lambda: _download(session, url, timeout), hedge_after, timeout)
+        return body
     except Exception as e:
         print(f"Image fetch failed: {url} ({e})")
     return None
 
-async def fetch_all_images(urls):
-    async with aiohttp.ClientSession() as session:
-        tasks = [fetch_image(session, u) for u in urls if u]
-        results = await asyncio.gather(*tasks)
-        return dict(zip(urls, results))
+async def fetch_all_images(urls, session=None, deadline: Deadline = None):
+    urls = list(dict.fromkeys(u for u in urls if u))
+    deadline = deadline or Deadline(REPORT_IMAGE_DEADLINE_SECONDS)
+    if session is None:
+        async with aiohttp.ClientSession() as session:
+            return await fetch_all_images(urls, session, deadline)
+    tasks = [fetch_image(session, u, deadline) for u in urls]
+    results = await asyncio.gather(*tasks)
+    return dict(zip(urls, results))
 
 async def create_pdf_report(assignment_id) -> bytes:
     data = fetch_assignment_data(assignment_id)
     if not data:
         return None
 
-    assignment = data[0]
+    # --- FETCH ALL IMAGES FIRST (ASYNC) ---
+    image_urls = [row['image_url'] for row in data if row.get('image_id')]
+    image_map = await fetch_all_images(image_urls)
+
+    # Rendering is CPU-bound; keep it off the event loop.
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, render_pdf_report, assignment_id, data, image_map)
+
+def _shrink_image(path):
+    with PILImage.open(path) as img:
+        img.thumbnail((REPORT_IMAGE_MAX_PX, REPORT_IMAGE_MAX_PX))
+        img = img.convert("RGB")
+    img.save(path, format="JPEG", quality=85)
+
+async def download_image_to_file(session, url, path, deadline: Deadline):
+    """
+    Stream one image to path and downscale it for embedding.
+    Returns path, or None if the image could not be fetched in time.
+    """
+    try:
+        timeout = deadline.timeout_for(REPORT_IMAGE_TIMEOUT)
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            resp.raise_for_status()
+            with open(path, "wb") as f:
+                async for chunk in resp.content.iter_chunked(REPORT_STREAM_CHUNK_SIZE):
+                    f.write(chunk)
+        await asyncio.to_thread(_shrink_image, path)
+        return path
+    except Exception as e:
+        print(f"Image fetch failed: {url} ({e})")
+        return None
+
+async def download_report_images(urls, directory):
+    """
+    Download report images into directory, at most REPORT_FETCH_CONCURRENCY
+    at a time, so only a few downloads are ever buffered in memory.
+    Returns a map of image_url -> file path (or None).
+    """
+    urls = list(dict.fromkeys(u for u in urls if u))
+    deadline = Deadline(REPORT_IMAGE_DEADLINE_SECONDS)
+    semaphore = asyncio.Semaphore(REPORT_FETCH_CONCURRENCY)
+
+    async def fetch(session, index, url):
+        async with semaphore:
+            return await download_image_to_file(session, url, os.path.join(directory, f"{index}.img"), deadline)
+
+    async with aiohttp.ClientSession() as session:
+        paths = await asyncio.gather(*(fetch(session, i, u) for i, u in enumerate(urls)))
+    return dict(zip(urls, paths))
+
+def _iter_file(f, chunk_size=REPORT_STREAM_CHUNK_SIZE):
+    try:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        f.close()
+
+async def spool_pdf_report(assignment_id):
+    """
+    Build the report with bounded memory and return (chunks, length) for the
+    response, or None if the assignment has no data.
+
+    Images are downloaded to a temporary directory, downscaled and embedded
+    from disk; the PDF is written to a SpooledTemporaryFile that moves to disk
+    past REPORT_SPOOL_MAX_BYTES and is read back in chunks. This bounds memory,
+    not time to first byte: reportlab only writes the document once the whole
+    layout is done, so nothing can be sent before the PDF is complete.
+    """
+    data = await asyncio.to_thread(fetch_assignment_data, assignment_id)
+    if not data:
+        return None
+
+    directory = tempfile.mkdtemp(prefix=f"report_{assignment_id}_")
+    output = tempfile.SpooledTemporaryFile(max_size=REPORT_SPOOL_MAX_BYTES)
+    try:
+        image_urls = [row['image_url'] for row in data if row.get('image_id')]
+        image_map = await download_report_images(image_urls, directory)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, build_pdf_report, assignment_id, data, image_map, output)
+    except BaseException:
+        output.close()
+        raise
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    length = output.tell()
+    output.seek(0)
+    return _iter_file(output), length
+
+def render_pdf_report(assignment_id, data, image_map) -> bytes:
+    """
+    Render the PDF for one assignment from its report rows and a map of
+    image_url -> image bytes. Pure and picklable, so it can run in a worker process.
+    """
     buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    build_pdf_report(assignment_id, data, image_map, buffer)
+    return buffer.getvalue()
+
+def build_pdf_report(assignment_id, data, image_map, output):
+    """
+    Write the PDF for one assignment to the file-like output. image_map values
+    are image bytes or paths of image files; files are only opened while
+    their page is drawn.
+    """
+    assignment = data[0]
+    doc = SimpleDocTemplate(output, pagesize=A4)
     styles = getSampleStyleSheet()
     elements = []
 
@@ -170,6 +384,18 @@ async def create_pdf_report(assignment_id) -> bytes:
     elements.append(Paragraph(f"Assigned Visit Date: {assignment['assigned_visit_date']}", styles['Normal']))
     elements.append(Paragraph(f"Actual Visit Date: {assignment.get('actual_visit_date', 'Not Visited')}", styles['Normal']))
     elements.append(Paragraph(f"Status: {assignment['assignment_status']}", styles['Normal']))
+    if assignment.get('image_count') is not None:
+        elements.append(Paragraph(
+            f"Images: {assignment['image_count']} ({assignment['analysed_count']} analysed) - "
+            f"Pure: {assignment['pure_count']}, Abused: {assignment['abused_count']}, Empty: {assignment['empty_count']}",
+            styles['Normal']
+        ))
+        if assignment.get('avg_chargeability') is not None:
+            elements.append(Paragraph(f"Average Chargeability: {assignment['avg_chargeability']}%", styles['Normal']))
+        if assignment.get('detected_brands'):
+            elements.append(Paragraph(f"Brands Detected: {', '.join(assignment['detected_brands'])}", styles['Normal']))
+        if assignment.get('last_analysed_at'):
+            elements.append(Paragraph(f"Last Analysed: {assignment['last_analysed_at']}", styles['Normal']))
     elements.append(Spacer(1, 20))
 
     # # --- OBJECT SUMMARY (DISTINCT) ---
@@ -207,20 +433,13 @@ async def create_pdf_report(assignment_id) -> bytes:
     # --- OBJECT SUMMARY (DISTINCT) ---
     unique_objects = set()
     for row in data:
-        raw = row['detected_objects']
-        if not raw:
+        objects = parse_detected_objects(row['detected_objects'])
+        if not objects:
             continue
-        try:
-            if raw.startswith('"') and raw.endswith('"'):
-                raw = raw[1:-1].replace('\\"', '"')
-            objects = json.loads(raw)
-        except Exception:
-            try:
-                objects = ast.literal_eval(raw)
-            except Exception:
-                continue
 
         for obj in objects:
+            if not isinstance(obj, dict):
+                continue
             obj_name = obj.get('object') or "Unknown"
             obj_label = obj.get('label') or "-"
             unique_objects.add((obj_name, obj_label))
@@ -241,11 +460,6 @@ async def create_pdf_report(assignment_id) -> bytes:
 
     elements.append(PageBreak())
 
-    # --- FETCH ALL IMAGES FIRST (ASYNC) ---
-    image_urls = [row['image_url'] for row in data if row.get('image_id')]
-    # image_map = asyncio.run(fetch_all_images(image_urls))
-    image_map = await fetch_all_images(image_urls)
-
     # --- PER IMAGE DETAILS ---
     for row in data:
         if not row['image_id']:
@@ -253,10 +467,13 @@ async def create_pdf_report(assignment_id) -> bytes:
         elements.append(Paragraph(f"Image ID: {row['image_id']}", styles['Heading2']))
         elements.append(Paragraph(f"Uploaded: {row['upload_time']}", styles['Normal']))
 
-        img_bytes = image_map.get(row['image_url'])
-        if img_bytes:
+        img_source = image_map.get(row['image_url'])
+        if img_source:
             try:
-                img = Image(BytesIO(img_bytes), width=200, height=400)
+                if isinstance(img_source, str):
+                    img = Image(img_source, width=200, height=400, lazy=2)
+                else:
+                    img = Image(BytesIO(img_source), width=200, height=400)
                 elements.append(img)
             except Exception:
                 elements.append(Paragraph("[Image not available]", styles['Normal']))
@@ -312,5 +529,96 @@ async def create_pdf_report(assignment_id) -> bytes:
 
     # --- BUILD PDF ---
     doc.build(elements)
-    buffer.seek(0)
-    return buffer.getvalue()
+
+_report_pool = None
+
+def _get_report_pool():
+    global _report_pool
+    if _report_pool is None:
+        # Spawn rather than fork: the API process runs listener, hedge and
+        # analysis threads whose locks a forked child would inherit mid-use.
+        _report_pool = ProcessPoolExecutor(
+            max_workers=REPORT_PROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _report_pool
+
+async def _render_store_reports(store_assignment_ids, data_by_assignment, session, pool, semaphore, results):
+    # Download one store's images, render its reports and put (assignment_id,
+    # pdf_bytes, error) on results as each finishes. Every assignment is
+    # reported exactly once, even if this store fails part-way.
+    loop = asyncio.get_running_loop()
+    reported = set()
+    try:
+        async with semaphore:
+            store_urls = [
+                row['image_url']
+                for assignment_id in store_assignment_ids
+                for row in data_by_assignment[assignment_id]
+                if row.get('image_id')
+            ]
+            image_map = await fetch_all_images(store_urls, session)
+
+            pending = {}
+            for assignment_id in store_assignment_ids:
+                data = data_by_assignment[assignment_id]
+                report_images = {row['image_url']: image_map.get(row['image_url']) for row in data if row.get('image_id')}
+                future = loop.run_in_executor(pool, render_pdf_report, assignment_id, data, report_images)
+                pending[future] = assignment_id
+            del image_map
+
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    assignment_id = pending.pop(future)
+                    reported.add(assignment_id)
+                    try:
+                        await results.put((assignment_id, future.result(), None))
+                    except Exception as e:
+                        await results.put((assignment_id, None, e))
+    except Exception as e:
+        for assignment_id in store_assignment_ids:
+            if assignment_id not in reported:
+                await results.put((assignment_id, None, e))
+
+async def stream_bulk_reports(assignment_ids):
+    """
+    Render reports for many assignments across a process pool and stream them
+    back as a ZIP archive, one entry per report in completion order.
+
+    Assignments are grouped by store so every image URL is downloaded once per
+    store. Up to BULK_REPORT_STORES_IN_FLIGHT stores are processed at once, so
+    downloads for one store overlap with rendering for others while the
+    number of stores whose images are held in memory stays bounded.
+    """
+    pool = _get_report_pool()
+    data_by_assignment = await asyncio.to_thread(fetch_assignments_data, assignment_ids)
+
+    assignments_by_store = {}
+    for assignment_id, data in data_by_assignment.items():
+        assignments_by_store.setdefault(data[0]['store_id'], []).append(assignment_id)
+
+    buffer = ChunkBuffer()
+    results = asyncio.Queue()
+    semaphore = asyncio.Semaphore(BULK_REPORT_STORES_IN_FLIGHT)
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        async with aiohttp.ClientSession() as session:
+            tasks = [
+                asyncio.create_task(
+                    _render_store_reports(store_assignment_ids, data_by_assignment, session, pool, semaphore, results)
+                )
+                for store_assignment_ids in assignments_by_store.values()
+            ]
+            try:
+                for _ in range(len(data_by_assignment)):
+                    assignment_id, pdf_bytes, error = await results.get()
+                    if error is None:
+                        archive.writestr(f"report_{assignment_id}.pdf", pdf_bytes)
+                    else:
+                        print(f"Report rendering failed for assignment_id={assignment_id}: {error}")
+                        archive.writestr(f"report_{assignment_id}.error.txt", f"Report rendering failed: {error}")
+                    yield buffer.drain()
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+    yield buffer.drain()
@@ -0,0 +1,120 @@
+import os
+import uuid
+import psycopg2.extras
+from database import connect_to_db
+from service.analysis_service import CATALOG_VERSION, evaluate_cooler_smart
+from service.detection_schema import parse_detected_objects
+from service.summary_service import refresh_assignment_summaries
+
+RESCORE_BATCH_SIZE = int(os.getenv("RESCORE_BATCH_SIZE", "2000"))
+# Changed rows listed individually in a rescore result.
+RESCORE_DIFF_LIMIT = int(os.getenv("RESCORE_DIFF_LIMIT", "200"))
+
+RESCORE_QUERY = """
+    SELECT image_id, assignment_id, detected_objects, chargeability, auditable_photo,
+           purity, abused, emptyy, analysis_version
+    FROM public.storeassignmentimages
+    WHERE status = 'analysed'
+      AND detected_objects IS NOT NULL
+      AND (%(assignment_id)s IS NULL OR assignment_id = %(assignment_id)s)
+    ORDER BY image_id
+"""
+
+RESCORE_UPDATE = """
+    UPDATE public.storeassignmentimages AS sai
+    SET purity = v.purity,
+        abused = v.abused,
+        emptyy = v.emptyy,
+        analysis_version = v.analysis_version
+    FROM (VALUES %s) AS v (image_id, purity, abused, emptyy, analysis_version)
+    WHERE sai.image_id = v.image_id
+"""
+
+def rescored_version(analysis_version: str) -> str:
+    """
+    Keep the detection part of a stored version and stamp the current catalog,
+    so run_analysis does not re-detect images that were only re-scored.
+    """
+    if not analysis_version or ":" not in analysis_version:
+        return analysis_version
+    return f"{analysis_version.rsplit(':', 1)[0]}:{CATALOG_VERSION}"
+
+def rescore_detections(dry_run: bool = True, assignment_id: int = None, batch_size: int = RESCORE_BATCH_SIZE) -> dict:
+    """
+    Re-apply evaluate_cooler_smart to stored detections without calling the detector.
+
+    Rows are streamed from a server-side cursor in batches. Unless dry_run is
+    set, each batch's changes are written with one UPDATE ... FROM (VALUES ...)
+    on a second connection and committed.
+
+    Returns:
+        dict: Counts of scanned, changed and unparseable rows, plus up to
+        RESCORE_DIFF_LIMIT before/after diffs.
+    """
+    summary = {"dry_run": dry_run, "scanned": 0, "changed": 0, "unparseable": 0, "diff": [], "diff_truncated": False}
+    read_conn = None
+    write_conn = None
+    try:
+        _, read_conn = connect_to_db()
+        if not dry_run:
+            _, write_conn = connect_to_db()
+
+        with read_conn.cursor(name=f"rescore_{uuid.uuid4().hex}", cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(RESCORE_QUERY, {"assignment_id": assignment_id})
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+
+                updates = []
+                changed_assignments = set()
+                for row in rows:
+                    summary["scanned"] += 1
+                    objects = parse_detected_objects(row["detected_objects"])
+                    if objects is None:
+                        summary["unparseable"] += 1
+                        continue
+                    try:
+                        result = evaluate_cooler_smart({
+                            "objects": objects,
+                            "chargeability_percentage": row["chargeability"],
+                            "auditable": row["auditable_photo"],
+                        })
+                    except (ValueError, RuntimeError):
+                        summary["unparseable"] += 1
+                        continue
+
+                    before = {"purity": row["purity"], "abused": row["abused"], "empty": row["emptyy"]}
+                    after = {"purity": result["purity"], "abused": result["abused"], "empty": result["empty"]}
+                    version = rescored_version(row["analysis_version"])
+                    if before != after:
+                        summary["changed"] += 1
+                        if len(summary["diff"]) < RESCORE_DIFF_LIMIT:
+                            summary["diff"].append({
+                                "image_id": row["image_id"],
+                                "assignment_id": row["assignment_id"],
+                                "before": before,
+                                "after": after,
+                            })
+                        else:
+                            summary["diff_truncated"] = True
+                    if before != after or version != row["analysis_version"]:
+                        updates.append((row["image_id"], after["purity"], after["abused"], after["empty"], version))
+                        changed_assignments.add(row["assignment_id"])
+
+                if write_conn is not None and updates:
+                    with write_conn.cursor() as write_cursor:
+                        psycopg2.extras.execute_values(write_cursor, RESCORE_UPDATE, updates, page_size=len(updates))
+                        refresh_assignment_summaries(write_cursor, changed_assignments)
+                    write_conn.commit()
+
+        print(f"🔁 Rescore {'dry run' if dry_run else 'run'}: scanned={summary['scanned']} changed={summary['changed']} unparseable={summary['unparseable']}")
+        return summary
+
+    finally:
+        if read_conn:
+            read_conn.rollback()
+            read_conn.close()
+        if write_conn:
+            write_conn.close()
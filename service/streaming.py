@@ -0,0 +1,38 @@
+class ChunkBuffer:
+    """
+    Write-only, non-seekable file object that collects written bytes until drained.
+
+    Lets writers that expect a file (zipfile, pyarrow, ...) feed a streaming
+    response: write into the buffer, then yield buffer.drain() as the next chunk.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
@@ -0,0 +1,95 @@
+import re
+from service.detection_schema import parse_detected_objects
+
+SUMMARY_COLUMNS = (
+    "image_count", "analysed_count", "pure_count", "abused_count", "empty_count",
+    "avg_chargeability", "detected_brands", "last_analysed_at",
+)
+
+UPSERT_SUMMARY_QUERY = """
+    INSERT INTO public.storeassignment_summary
+        (assignment_id, image_count, analysed_count, pure_count, abused_count, empty_count,
+         avg_chargeability, detected_brands, last_analysed_at, updated_at)
+    VALUES (%(assignment_id)s, %(image_count)s, %(analysed_count)s, %(pure_count)s, %(abused_count)s,
+            %(empty_count)s, %(avg_chargeability)s, %(detected_brands)s,
+            CASE WHEN %(analysed)s THEN now() ELSE %(last_model_call)s END, now())
+    ON CONFLICT (assignment_id) DO UPDATE
+    SET image_count = EXCLUDED.image_count,
+        analysed_count = EXCLUDED.analysed_count,
+        pure_count = EXCLUDED.pure_count,
+        abused_count = EXCLUDED.abused_count,
+        empty_count = EXCLUDED.empty_count,
+        avg_chargeability = EXCLUDED.avg_chargeability,
+        detected_brands = EXCLUDED.detected_brands,
+        last_analysed_at = CASE WHEN %(analysed)s THEN now()
+                                ELSE COALESCE(storeassignment_summary.last_analysed_at, EXCLUDED.last_analysed_at) END,
+        updated_at = now()
+"""
+
+_NUMBER = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*%?\s*$")
+
+def _chargeability(value):
+    if value is None:
+        return None
+    match = _NUMBER.match(str(value))
+    return float(match.group(1)) if match else None
+
+def summarize_images(rows) -> dict:
+    """
+    Roll up (status, purity, abused, emptyy, chargeability, detected_objects)
+    image rows into the storeassignment_summary columns.
+    """
+    summary = {"image_count": 0, "analysed_count": 0, "pure_count": 0, "abused_count": 0, "empty_count": 0}
+    chargeability = []
+    brands = set()
+    for status, purity, abused, emptyy, charge, detected_objects in rows:
+        summary["image_count"] += 1
+        if status != "analysed":
+            continue
+        summary["analysed_count"] += 1
+        summary["pure_count"] += purity == "Pure"
+        summary["abused_count"] += abused == "Yes"
+        summary["empty_count"] += emptyy == "Yes"
+        value = _chargeability(charge)
+        if value is not None:
+            chargeability.append(value)
+        for obj in parse_detected_objects(detected_objects) or []:
+            if isinstance(obj, dict) and obj.get("label"):
+                brands.add(obj["label"])
+    summary["avg_chargeability"] = round(sum(chargeability) / len(chargeability), 2) if chargeability else None
+    summary["detected_brands"] = sorted(brands)
+    return summary
+
+def refresh_assignment_summary(cursor, assignment_id: int, analysed: bool = False):
+    """
+    Recompute the summary row of one assignment inside the caller's
+    transaction, so it commits or rolls back with the image changes.
+
+    The assignment row is locked first, so concurrent refreshes of the same
+    assignment serialize and the later one sees the earlier one's images.
+    analysed=True stamps last_analysed_at; otherwise it is kept, or taken
+    from the latest recorded model call when the row is new.
+    """
+    with cursor.connection.cursor() as c:
+        c.execute("SELECT 1 FROM public.storeassignments WHERE assignment_id = %s FOR UPDATE", (assignment_id,))
+        if c.fetchone() is None:
+            return
+        c.execute(
+            """
+            SELECT status, purity, abused, emptyy, chargeability, detected_objects
+            FROM public.storeassignmentimages
+            WHERE assignment_id = %s
+            """,
+            (assignment_id,)
+        )
+        summary = summarize_images(c.fetchall())
+        last_model_call = None
+        if not analysed:
+            c.execute("SELECT max(created_at) FROM public.model_calls WHERE assignment_id = %s", (assignment_id,))
+            last_model_call = c.fetchone()[0]
+        c.execute(UPSERT_SUMMARY_QUERY, dict(summary, assignment_id=assignment_id, analysed=analysed, last_model_call=last_model_call))
+
+def refresh_assignment_summaries(cursor, assignment_ids, analysed: bool = False):
+    # Sorted, so concurrent multi-assignment refreshes take row locks in the same order.
+    for assignment_id in sorted(set(assignment_ids)):
+        refresh_assignment_summary(cursor, assignment_id, analysed)
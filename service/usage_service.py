@@ -0,0 +1,82 @@
+from psycopg2.extras import RealDictCursor
+from database import connect_for_read, connect_to_db
+
+# group_by value -> SQL expression for the aggregation key.
+USAGE_GROUPS = {
+    "assignment": "mc.assignment_id",
+    "manager": "sa.assigned_by",
+    "day": "date_trunc('day', mc.created_at)::date",
+}
+
+# {key} and {group_by} are filled in from USAGE_GROUPS, never from the request.
+MODEL_USAGE_QUERY = """
+    SELECT
+        {key} AS {group_by},
+        count(*) AS calls,
+        count(*) FILTER (WHERE mc.success) AS successful_calls,
+        count(DISTINCT mc.image_id) AS images,
+        COALESCE(sum(mc.input_tokens), 0) AS input_tokens,
+        COALESCE(sum(mc.output_tokens), 0) AS output_tokens,
+        COALESCE(sum(mc.cached_tokens), 0) AS cached_tokens,
+        COALESCE(sum(mc.retries), 0) AS retries,
+        count(*) FILTER (WHERE mc.cache_hit) AS cache_hits,
+        round(avg(mc.latency_ms)) AS avg_latency_ms,
+        percentile_cont(0.95) WITHIN GROUP (ORDER BY mc.latency_ms) AS p95_latency_ms,
+        max(mc.latency_ms) AS max_latency_ms
+    FROM public.model_calls mc
+    JOIN public.storeassignments sa ON mc.assignment_id = sa.assignment_id
+    WHERE (%(manager_id)s IS NULL OR sa.assigned_by = %(manager_id)s)
+      AND (%(date_from)s::date IS NULL OR mc.created_at >= %(date_from)s::date)
+      AND (%(date_to)s::date IS NULL OR mc.created_at < %(date_to)s::date + 1)
+    GROUP BY 1
+    ORDER BY 1
+"""
+
+def record_model_call(image_id: int, assignment_id: int, stats: dict):
+    """
+    Persist one detector call (latency, tokens, retries, cache hit/miss) for image_id.
+    Accounting must never break analysis, so errors are only logged.
+    """
+    connection = None
+    try:
+        curr, connection = connect_to_db()
+        cursor = connection.cursor()
+        cursor.execute(
+            """
+            INSERT INTO public.model_calls
+                (image_id, assignment_id, backend, model_name, latency_ms,
+                 input_tokens, output_tokens, cached_tokens, retries, cache_hit, success, error)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """,
+            (
+                image_id, assignment_id, stats.get("backend"), stats.get("model_name"), stats.get("latency_ms"),
+                stats.get("input_tokens"), stats.get("output_tokens"), stats.get("cached_tokens"),
+                stats.get("retries", 0), stats.get("cache_hit"), stats.get("success"), stats.get("error"),
+            )
+        )
+        connection.commit()
+    except Exception as e:
+        print(f"Error recording model call for image_id={image_id}: {e}")
+    finally:
+        if connection:
+            connection.close()
+
+def model_usage(group_by: str, manager_id: int = None, date_from=None, date_to=None) -> list:
+    """
+    Aggregate recorded model calls per assignment, manager or day.
+
+    Raises:
+        ValueError: If group_by is not one of USAGE_GROUPS.
+    """
+    if group_by not in USAGE_GROUPS:
+        raise ValueError(f"group_by must be one of {', '.join(USAGE_GROUPS)}.")
+    query = MODEL_USAGE_QUERY.format(key=USAGE_GROUPS[group_by], group_by=group_by)
+    connection = None
+    try:
+        curr, connection = connect_for_read()
+        with connection.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(query, {"manager_id": manager_id, "date_from": date_from, "date_to": date_to})
+            return cursor.fetchall()
+    finally:
+        if connection:
+            connection.close()
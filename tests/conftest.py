@@ -0,0 +1,5 @@
+import os
+
+# Importing service.analysis_service builds the detector; the fake backend
+# needs no API key or model files.
+os.environ.setdefault("DETECTOR_BACKEND", "fake")
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+import time
+import pytest
+from fastapi import HTTPException
+import routes.manager as manager_routes
+from service.admission_service import AnalysisAdmission, QueueFullError
+
+class BlockingRun:
+    """
+    Stands in for run_analysis: records each call and blocks until released.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.started = threading.Semaphore(0)
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+
+    def __call__(self, assignment_id, force):
+        with self._lock:
+            self.calls.append((assignment_id, force))
+        self.started.release()
+        assert self.release.wait(5)
+        return assignment_id
+
+    def wait_started(self, count=1):
+        for _ in range(count):
+            assert self.started.acquire(timeout=5)
+
+def test_repeat_submit_joins_the_inflight_run():
+    run = BlockingRun()
+    admission = AnalysisAdmission(run, max_concurrent=2, max_queue=2)
+    first, joined, followup = admission.submit(1)
+    assert (joined, followup) == (False, False)
+    again, joined, followup = admission.submit(1)
+    assert again is first
+    assert (joined, followup) == (True, False)
+
+    run.release.set()
+    assert first.result(timeout=5) == 1
+    assert run.calls == [(1, False)]
+
+def test_forced_submit_queues_a_single_forced_rerun():
+    run = BlockingRun()
+    admission = AnalysisAdmission(run, max_concurrent=1, max_queue=1)
+    first, _, _ = admission.submit(1)
+    run.wait_started()
+    assert admission.submit(1, force=True)[1:] == (True, True)
+    assert admission.submit(1, force=True)[1:] == (True, True)
+
+    run.release.set()
+    first.result(timeout=5)
+    run.wait_started()
+    assert run.calls == [(1, False), (1, True)]
+    for _ in range(100):
+        if not admission.inflight():
+            break
+        time.sleep(0.05)
+    assert admission.inflight() == []
+
+def test_forced_submit_joining_a_forced_run_queues_nothing():
+    run = BlockingRun()
+    admission = AnalysisAdmission(run, max_concurrent=1, max_queue=1)
+    first, _, _ = admission.submit(1, force=True)
+    assert admission.submit(1, force=True)[1:] == (True, False)
+    run.release.set()
+    first.result(timeout=5)
+    assert run.calls == [(1, True)]
+
+def test_submit_beyond_the_queue_raises_with_retry_after():
+    run = BlockingRun()
+    admission = AnalysisAdmission(run, max_concurrent=1, max_queue=1)
+    admission.submit(1)
+    admission.submit(2)
+    with pytest.raises(QueueFullError) as error:
+        admission.submit(3)
+    assert error.value.retry_after >= 1
+    # Joining an in-flight run is still allowed when the queue is full.
+    assert admission.submit(2)[1] is True
+    run.release.set()
+
+def test_analyse_visit_returns_429_when_the_queue_is_full(monkeypatch):
+    run = BlockingRun()
+    admission = AnalysisAdmission(run, max_concurrent=1, max_queue=0)
+    monkeypatch.setattr(manager_routes, "analysis_admission", admission)
+    assert asyncio.run(manager_routes.analyse_visit(1))["status"] == "Analysis started"
+    assert asyncio.run(manager_routes.analyse_visit(1))["status"] == "Analysis already running"
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(manager_routes.analyse_visit(2))
+    assert error.value.status_code == 429
+    assert int(error.value.headers["Retry-After"]) >= 1
+    run.release.set()
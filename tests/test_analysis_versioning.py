@@ -0,0 +1,29 @@
+from service.analysis_service import ANALYSIS_VERSION, REJECTION_VERSION, needs_analysis, result_version
+
+def test_new_and_failed_images_are_always_analysed():
+    assert needs_analysis({"status": "pending", "analysis_version": None})
+    assert needs_analysis({"status": "failed", "analysis_version": ANALYSIS_VERSION})
+
+def test_analysed_images_are_skipped_only_at_the_current_version():
+    assert not needs_analysis({"status": "analysed", "analysis_version": ANALYSIS_VERSION})
+    assert needs_analysis({"status": "analysed", "analysis_version": "old-detector:old-catalog"})
+    assert needs_analysis({"status": "analysed", "analysis_version": None})
+
+def test_rejected_images_are_retried_when_the_prefilter_changes():
+    assert not needs_analysis({"status": "rejected", "analysis_version": REJECTION_VERSION})
+    assert needs_analysis({"status": "rejected", "analysis_version": "prefilter:0000000000"})
+
+def test_force_reanalyses_everything():
+    assert needs_analysis({"status": "analysed", "analysis_version": ANALYSIS_VERSION}, force=True)
+    assert needs_analysis({"status": "rejected", "analysis_version": REJECTION_VERSION}, force=True)
+
+def test_result_version_is_null_for_degraded_or_repaired_results():
+    assert result_version({"objects": []}) == ANALYSIS_VERSION
+    assert result_version({"objects": [], "degraded": True}) is None
+    assert result_version({"objects": [], "repaired": True}) is None
+
+def test_degraded_results_are_picked_up_again():
+    stored = {"status": "analysed", "analysis_version": result_version({"degraded": True})}
+    assert needs_analysis(stored)
+    stored = {"status": "analysed", "analysis_version": result_version({"objects": []})}
+    assert not needs_analysis(stored)
@@ -0,0 +1,92 @@
+import threading
+from starlette.requests import Request
+from service.cache_service import ReadThroughCache, cached_response, etag_matches
+
+def _request(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+class Loader:
+    def __init__(self, data):
+        self.data = data
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.data
+
+def test_hit_serves_the_cached_data_and_etag():
+    cache = ReadThroughCache(ttl=60)
+    loader = Loader([{"id": 1, "name": "Sprite"}])
+    first = cache.get("brands", loader)
+    assert cache.get("brands", loader) == first
+    assert loader.calls == 1
+
+def test_etag_follows_the_content():
+    cache = ReadThroughCache(ttl=60)
+    _, etag = cache.get("a", Loader({"x": 1, "y": 2}))
+    _, same = cache.get("b", Loader({"y": 2, "x": 1}))
+    _, other = cache.get("c", Loader({"x": 1, "y": 3}))
+    assert etag == same != other
+    assert etag.startswith('"') and etag.endswith('"')
+
+def test_expired_entries_are_reloaded():
+    cache = ReadThroughCache(ttl=0)
+    loader = Loader([])
+    cache.get("brands", loader)
+    cache.get("brands", loader)
+    assert loader.calls == 2
+
+def test_invalidate_drops_one_key_or_all():
+    cache = ReadThroughCache(ttl=60)
+    brands, stores = Loader([1]), Loader([2])
+    cache.get("brands", brands)
+    cache.get("stores", stores)
+    cache.invalidate("brands")
+    cache.get("brands", brands)
+    cache.get("stores", stores)
+    assert (brands.calls, stores.calls) == (2, 1)
+    cache.invalidate()
+    cache.get("stores", stores)
+    assert stores.calls == 2
+
+def test_load_racing_an_invalidation_is_not_cached():
+    cache = ReadThroughCache(ttl=60)
+    loading, invalidated = threading.Event(), threading.Event()
+
+    def stale_loader():
+        loading.set()
+        assert invalidated.wait(5)
+        return ["stale"]
+
+    worker = threading.Thread(target=cache.get, args=("brands", stale_loader))
+    worker.start()
+    assert loading.wait(5)
+    cache.invalidate("brands")
+    invalidated.set()
+    worker.join(5)
+
+    assert cache.get("brands", Loader(["fresh"]))[0] == ["fresh"]
+
+def test_etag_matching():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('"x", W/"abc"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"x"', '"abc"')
+    assert not etag_matches(None, '"abc"')
+
+def test_cached_response_is_304_for_a_matching_etag():
+    data, etag = ReadThroughCache(ttl=60).get("brands", Loader([{"id": 1}]))
+    response = cached_response(_request(etag), data, etag)
+    assert response.status_code == 304
+    assert response.body == b""
+    assert response.headers["etag"] == etag
+
+def test_cached_response_sends_the_body_otherwise():
+    data, etag = ReadThroughCache(ttl=60).get("brands", Loader([{"id": 1}]))
+    for request in (_request(), _request('"stale"')):
+        response = cached_response(request, data, etag)
+        assert response.status_code == 200
+        assert response.body == b'[{"id":1}]'
+        assert response.headers["etag"] == etag
+        assert response.headers["cache-control"] == "private, no-cache"
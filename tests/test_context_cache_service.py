@@ -0,0 +1,149 @@
+import datetime
+from PIL import Image
+from service.context_cache_service import PromptCache
+from service.detector_service import GeminiDetector
+
+class FakeCache:
+    def __init__(self, name, expires_at):
+        self.name = name
+        self.expire_time = datetime.datetime.fromtimestamp(expires_at, datetime.timezone.utc)
+
+class FakeCacheClient:
+    """
+    Stands in for GenaiCacheClient: keeps caches in a dict keyed by display name.
+    """
+
+    def __init__(self, clock, existing=None, fail_create=False):
+        self.clock = clock
+        self.caches = dict(existing or {})
+        self.fail_create = fail_create
+        self.calls = []
+
+    def find(self, display_name):
+        self.calls.append("find")
+        return self.caches.get(display_name)
+
+    def create(self, model_name, system_instruction, ttl_seconds, display_name):
+        self.calls.append("create")
+        if self.fail_create:
+            raise RuntimeError("content is below the minimum cacheable size")
+        cache = FakeCache(display_name, self.clock() + ttl_seconds)
+        self.caches[display_name] = cache
+        return cache
+
+    def extend(self, cache, ttl_seconds):
+        self.calls.append("extend")
+        cache.expire_time = datetime.datetime.fromtimestamp(self.clock() + ttl_seconds, datetime.timezone.utc)
+        return cache
+
+    def model_for(self, cache):
+        return ("cached-model", cache.name)
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def _prompt_cache(client, clock, **kwargs):
+    return PromptCache(client, "gemini-test", "system prompt", "fallback-model", ttl_seconds=3600,
+                       refresh_margin_seconds=300, retry_seconds=60, clock=clock, **kwargs)
+
+def test_handle_is_keyed_by_model_and_prompt():
+    clock = Clock()
+    a = _prompt_cache(FakeCacheClient(clock), clock)
+    b = _prompt_cache(FakeCacheClient(clock), clock)
+    c = PromptCache(FakeCacheClient(clock), "gemini-test", "another prompt", None, clock=clock)
+    assert a.display_name == b.display_name != c.display_name
+
+def test_existing_handle_is_reused_and_then_cached_in_process():
+    clock = Clock()
+    display_name = _prompt_cache(FakeCacheClient(clock), clock).display_name
+    client = FakeCacheClient(clock, existing={display_name: FakeCache(display_name, clock() + 1800)})
+    cache = _prompt_cache(client, clock)
+
+    assert cache.get_model() == (("cached-model", display_name), True)
+    assert cache.get_model() == (("cached-model", display_name), True)
+    assert client.calls == ["find", "extend"]
+
+def test_ttl_is_extended_shortly_before_expiry():
+    clock = Clock()
+    client = FakeCacheClient(clock)
+    cache = _prompt_cache(client, clock)
+    cache.get_model()
+    assert client.calls == ["find", "create"]
+
+    clock.now += 3600 - 400
+    cache.get_model()
+    assert client.calls == ["find", "create"]
+
+    clock.now += 200
+    model, cached = cache.get_model()
+    assert cached is True
+    assert client.calls == ["find", "create", "extend"]
+    assert client.caches[cache.display_name].expire_time.timestamp() == clock() + 3600
+
+def test_expired_handle_is_recreated():
+    clock = Clock()
+    client = FakeCacheClient(clock)
+    cache = _prompt_cache(client, clock)
+    cache.get_model()
+    clock.now += 7200
+    cache.get_model()
+    assert client.calls == ["find", "create", "create"]
+
+def test_falls_back_to_uncached_model_when_create_fails_and_retries_later():
+    clock = Clock()
+    client = FakeCacheClient(clock, fail_create=True)
+    cache = _prompt_cache(client, clock)
+
+    assert cache.get_model() == ("fallback-model", False)
+    assert cache.get_model() == ("fallback-model", False)
+    assert client.calls == ["find", "create"]
+
+    client.fail_create = False
+    clock.now += 61
+    model, cached = cache.get_model()
+    assert cached is True
+    assert client.calls == ["find", "create", "create"]
+
+class FakeResponse:
+    text = '{"objects": [{"object": "bottle", "label": "Sprite"}], "auditable": "Yes"}'
+    usage_metadata = None
+
+class FakeModel:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = 0
+
+    def generate_content(self, parts, request_options=None):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("cached content not found")
+        return FakeResponse()
+
+class StubPromptCache:
+    def __init__(self, model):
+        self.model = model
+        self.invalidated = False
+
+    def get_model(self):
+        return self.model, True
+
+    def invalidate(self):
+        self.invalidated = True
+
+def test_failed_cached_call_is_retried_uncached():
+    cached_model, fallback = FakeModel(fail=True), FakeModel()
+    prompt_cache = StubPromptCache(cached_model)
+    detector = GeminiDetector(fallback, "gemini-test:v1", prompt_cache)
+    stats = {}
+
+    result = detector.detect(Image.new("RGB", (8, 8)), stats)
+
+    assert result["objects"] == [{"object": "bottle", "label": "Sprite"}]
+    assert (cached_model.calls, fallback.calls) == (1, 1)
+    assert prompt_cache.invalidated
+    assert stats["cache_hit"] is False
+    assert stats["retries"] == 1
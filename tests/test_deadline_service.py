@@ -0,0 +1,96 @@
+import asyncio
+import threading
+import time
+import pytest
+from service.deadline_service import Deadline, DeadlineExceeded, LatencyTracker, hedged_async, hedged_call
+
+class Clock:
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def test_deadline_caps_stage_timeouts_by_what_is_left():
+    clock = Clock()
+    deadline = Deadline(30, clock=clock)
+    assert deadline.timeout_for(10) == 10
+    clock.now += 25
+    assert deadline.timeout_for(10) == 5
+    assert not deadline.expired()
+
+def test_spent_deadline_raises():
+    clock = Clock()
+    deadline = Deadline(5, clock=clock)
+    clock.now += 6
+    assert deadline.expired()
+    assert deadline.remaining() == 0.0
+    with pytest.raises(DeadlineExceeded):
+        deadline.timeout_for(10)
+
+def test_tracker_suggests_no_hedge_until_it_has_enough_samples():
+    tracker = LatencyTracker(percentile=0.9, min_samples=10, min_delay=0.01)
+    for i in range(9):
+        tracker.record(i / 10)
+    assert tracker.hedge_delay() is None
+    tracker.record(0.9)
+    assert tracker.hedge_delay() == 0.9
+
+def test_tracker_never_hedges_sooner_than_min_delay():
+    tracker = LatencyTracker(min_samples=1, min_delay=0.2)
+    tracker.record(0.001)
+    assert tracker.hedge_delay() == 0.2
+
+def test_fast_call_is_not_hedged():
+    assert hedged_call(lambda cancel: "ok", hedge_after=1.0, timeout=5) == ("ok", False)
+
+def test_slow_call_is_hedged_and_the_loser_cancelled():
+    attempts = []
+    lock = threading.Lock()
+
+    def fetch(cancel):
+        with lock:
+            attempt = len(attempts)
+            attempts.append(cancel)
+        if attempt == 0:
+            cancel.wait(5)
+            return "slow"
+        return "fast"
+
+    assert hedged_call(fetch, hedge_after=0.05, timeout=5) == ("fast", True)
+    assert len(attempts) == 2
+    assert attempts[0].wait(1)
+
+def test_failure_before_the_hedge_point_is_raised_without_retrying():
+    calls = []
+
+    def fetch(cancel):
+        calls.append(1)
+        raise ValueError("bad image")
+
+    with pytest.raises(ValueError):
+        hedged_call(fetch, hedge_after=1.0, timeout=5)
+    assert len(calls) == 1
+
+def test_no_result_within_timeout_raises_deadline_exceeded():
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        hedged_call(lambda cancel: cancel.wait(5), hedge_after=None, timeout=0.1)
+    assert time.monotonic() - started < 1
+
+def test_async_slow_call_is_hedged():
+    attempts = []
+
+    async def fetch():
+        attempts.append(1)
+        await asyncio.sleep(5 if len(attempts) == 1 else 0)
+        return len(attempts)
+
+    assert asyncio.run(hedged_async(fetch, hedge_after=0.05, timeout=5)) == (2, True)
+
+def test_async_timeout_raises_deadline_exceeded():
+    async def fetch():
+        await asyncio.sleep(5)
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(hedged_async(fetch, hedge_after=None, timeout=0.1))
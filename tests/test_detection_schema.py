@@ -0,0 +1,55 @@
+import json
+import pytest
+from service.detection_schema import parse_detection, repair_json
+
+def test_valid_output_is_not_marked_repaired():
+    result = parse_detection('{"objects": [{"object": "bottle", "label": "Sprite"}], "auditable": "Yes"}')
+    assert result["objects"] == [{"object": "bottle", "label": "Sprite"}]
+    assert "repaired" not in result
+
+def test_fenced_output_with_chatter_is_not_marked_repaired():
+    text = 'Here you go:\n```json\n{"objects": [{"object": "can", "label": "Fanta"}]}\n```\nAnything else?'
+    result = parse_detection(text)
+    assert result["objects"] == [{"object": "can", "label": "Fanta"}]
+    assert "repaired" not in result
+
+def test_half_written_array_element_is_dropped():
+    text = '{"objects":[{"object":"bottle","label":"Sprite"},{"object":"can","label":"Fa'
+    result = parse_detection(text)
+    assert result["objects"] == [{"object": "bottle", "label": "Sprite"}]
+    assert result["repaired"] is True
+
+def test_element_cut_between_members_is_dropped():
+    text = '{"objects":[{"object":"bottle","label":"Sprite"},{"object":"can",'
+    result = parse_detection(text)
+    assert result["objects"] == [{"object": "bottle", "label": "Sprite"}]
+
+def test_number_cut_mid_value_is_not_kept():
+    text = '{"objects":[{"object":"bottle","label":"Sprite"}],"chargeability_percentage":5'
+    result = parse_detection(text)
+    assert result["chargeability_percentage"] is None
+    assert result["objects"] == [{"object": "bottle", "label": "Sprite"}]
+    assert result["repaired"] is True
+
+def test_escaped_quotes_inside_strings_are_respected():
+    text = '{"objects":[{"object":"bottle","label":"Coke \\"Zero\\""},{"object":"can","label":"Sp'
+    result = parse_detection(text)
+    assert result["objects"] == [{"object": "bottle", "label": 'Coke "Zero"'}]
+
+def test_truncation_before_objects_array_closes_its_first_element_fails():
+    with pytest.raises(ValueError):
+        parse_detection('{"objects":[{"object":"bottle","lab')
+
+def test_truncation_that_would_lose_objects_key_fails():
+    # Cutting back to the first member would drop "objects" entirely and
+    # read as an empty cooler.
+    with pytest.raises(ValueError):
+        parse_detection('{"auditable":"Yes","objects":[{"object":"bott')
+
+def test_repair_json_returns_parseable_text():
+    repaired = repair_json('{"objects":[{"object":"bottle","label":"Sprite"},{"obj')
+    assert json.loads(repaired) == {"objects": [{"object": "bottle", "label": "Sprite"}]}
+
+def test_no_json_object_raises():
+    with pytest.raises(ValueError):
+        repair_json("I could not analyse this image.")
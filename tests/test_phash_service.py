@@ -0,0 +1,54 @@
+import random
+from PIL import Image, ImageFilter
+from service.phash_service import BKTree, dhash, hamming_distance, hash_to_hex, hex_to_hash, is_distinctive
+
+def _photo(seed: int, size=(320, 240)) -> Image.Image:
+    rng = random.Random(seed)
+    img = Image.new("RGB", size)
+    img.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(size[0] * size[1])])
+    return img.resize((32, 24)).resize(size, Image.BILINEAR)
+
+def test_dhash_is_stable_across_resize_and_blur():
+    img = _photo(1)
+    variant = img.resize((640, 480)).filter(ImageFilter.GaussianBlur(1))
+    assert hamming_distance(dhash(img), dhash(variant)) <= 6
+
+def test_dhash_separates_different_photos():
+    assert hamming_distance(dhash(_photo(1)), dhash(_photo(2))) > 6
+
+def test_hex_round_trip():
+    value = dhash(_photo(3))
+    assert len(hash_to_hex(value)) == 16
+    assert hex_to_hash(hash_to_hex(value)) == value
+
+def test_flat_frames_are_not_distinctive():
+    black = dhash(Image.new("RGB", (320, 240)))
+    grey = dhash(Image.new("RGB", (320, 240), (128, 128, 128)))
+    assert not is_distinctive(black)
+    assert not is_distinctive(grey)
+    assert is_distinctive(dhash(_photo(4)))
+
+def test_bktree_returns_matches_within_radius_closest_first():
+    tree = BKTree()
+    tree.add(0b0000, "a")
+    tree.add(0b0001, "b")
+    tree.add(0b0111, "c")
+    tree.add(0b1111_1111, "d")
+    assert len(tree) == 4
+    assert tree.search(0b0000, max_distance=1) == [(0, "a"), (1, "b")]
+    matches = tree.search(0b0011, max_distance=2)
+    assert [distance for distance, _ in matches] == [1, 1, 2]
+    assert {item for _, item in matches[:2]} == {"b", "c"}
+
+def test_bktree_search_matches_brute_force():
+    rng = random.Random(7)
+    values = [rng.getrandbits(64) for _ in range(300)]
+    tree = BKTree()
+    for i, value in enumerate(values):
+        tree.add(value, i)
+    query = values[10] ^ 0b101
+    expected = sorted(i for i, value in enumerate(values) if hamming_distance(query, value) <= 12)
+    assert sorted(item for _, item in tree.search(query, max_distance=12)) == expected
+
+def test_empty_bktree_finds_nothing():
+    assert BKTree().search(0) == []
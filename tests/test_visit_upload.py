@@ -0,0 +1,154 @@
+import datetime
+import psycopg2.extras
+import pytest
+from azure.core.exceptions import ResourceNotFoundError
+from fastapi import HTTPException
+import routes.user as user_routes
+from routes.user import UploadCompleteRequest, UploadInitRequest, complete_visit_upload, init_visit_upload
+
+BLOB_URL = "https://blobs.example.invalid/visits"
+
+class FakeCredential:
+    def __init__(self, account_key="a2V5"):
+        self.account_name = "devstoreaccount1"
+        self.account_key = account_key
+
+class FakeBlobClient:
+    def __init__(self, service, name):
+        self.service = service
+        self.url = f"{BLOB_URL}/{name}"
+        self.name = name
+
+    def get_blob_properties(self):
+        if self.name not in self.service.uploaded:
+            raise ResourceNotFoundError("The specified blob does not exist.")
+        return {"name": self.name}
+
+class FakeBlobServiceClient:
+    """
+    Stands in for BlobServiceClient (and Azurite): blobs in `uploaded` exist.
+    """
+
+    def __init__(self, uploaded=(), account_key="a2V5"):
+        self.uploaded = set(uploaded)
+        self.credential = FakeCredential(account_key)
+
+    def get_container_client(self, container_name):
+        return self
+
+    def get_blob_client(self, name):
+        return FakeBlobClient(self, name)
+
+class FakeDatabase:
+    def __init__(self, status="assigned", actual_visit_date=None):
+        self.assignment = {"status": status, "actual_visit_date": actual_visit_date}
+        self.images = []
+        self.commits = 0
+
+    def connect(self):
+        return None, FakeConnection(self)
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self, cursor_factory=None):
+        return FakeCursor(self.db)
+
+    def commit(self):
+        self.db.commits += 1
+
+    def close(self):
+        pass
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params):
+        assert "UPDATE public.storeassignments" in query
+        visited_at, _ = params
+        if self.db.assignment["status"] in ("assigned", "visited"):
+            self.db.assignment["status"] = "visited"
+            self.db.assignment["actual_visit_date"] = self.db.assignment["actual_visit_date"] or visited_at
+
+def fake_execute_values(cursor, query, rows, fetch=False):
+    inserted = []
+    for assignment_id, url in rows:
+        if url not in cursor.db.images:
+            cursor.db.images.append(url)
+            inserted.append({"image_id": len(cursor.db.images), "image_url": url})
+    return inserted
+
+@pytest.fixture
+def blobs(monkeypatch):
+    service = FakeBlobServiceClient()
+    monkeypatch.setattr(user_routes.BlobServiceClient, "from_connection_string", lambda *a, **k: service)
+    monkeypatch.setattr(user_routes, "generate_blob_sas", lambda **kwargs: "sig=fake")
+    return service
+
+@pytest.fixture
+def db(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(user_routes, "connect_to_db", database.connect)
+    monkeypatch.setattr(user_routes, "refresh_assignment_summary", lambda cursor, assignment_id: None)
+    monkeypatch.setattr(psycopg2.extras, "execute_values", fake_execute_values)
+    return database
+
+def test_init_issues_one_signed_url_per_file(blobs):
+    result = init_visit_upload(UploadInitRequest(assignment_id=7, files=[{"filename": "a b.jpg"}, {"filename": "c.png"}]), None)
+    assert [upload["blob_name"].split("/")[0] for upload in result["uploads"]] == ["7", "7"]
+    assert result["uploads"][0]["blob_name"].endswith("_a_b.jpg")
+    assert all(upload["upload_url"].endswith("?sig=fake") for upload in result["uploads"])
+
+def test_init_without_account_key_is_a_clear_client_error(blobs):
+    blobs.credential.account_key = None
+    with pytest.raises(HTTPException) as error:
+        init_visit_upload(UploadInitRequest(assignment_id=7, files=[{"filename": "a.jpg"}]), None)
+    assert error.value.status_code == 400
+    assert "account key" in error.value.detail
+
+def test_complete_with_only_missing_blobs_is_rejected(blobs, db):
+    with pytest.raises(HTTPException) as error:
+        complete_visit_upload(UploadCompleteRequest(assignment_id=7, blob_names=["7/missing.jpg"]), None)
+    assert error.value.status_code == 400
+    assert db.images == []
+    assert db.assignment["status"] == "assigned"
+
+def test_complete_rejects_blobs_of_another_assignment(blobs, db):
+    with pytest.raises(HTTPException) as error:
+        complete_visit_upload(UploadCompleteRequest(assignment_id=7, blob_names=["8/a.jpg"]), None)
+    assert error.value.status_code == 400
+
+def test_first_completion_marks_the_visit_visited(blobs, db):
+    blobs.uploaded.update({"7/a.jpg", "7/b.jpg"})
+    result = complete_visit_upload(UploadCompleteRequest(assignment_id=7, blob_names=["7/a.jpg", "7/b.jpg", "7/c.jpg"]), None)
+    assert len(result["inserted_images"]) == 2
+    assert result["missing_blobs"] == ["7/c.jpg"]
+    assert db.assignment["status"] == "visited"
+    assert db.assignment["actual_visit_date"] is not None
+
+def test_retry_inserts_nothing_and_leaves_the_visit_unchanged(blobs, db):
+    blobs.uploaded.add("7/a.jpg")
+    request = UploadCompleteRequest(assignment_id=7, blob_names=["7/a.jpg"])
+    complete_visit_upload(request, None)
+    db.assignment.update(status="analysed")
+    first_visit = db.assignment["actual_visit_date"]
+
+    result = complete_visit_upload(request, None)
+
+    assert result["inserted_images"] == []
+    assert db.assignment == {"status": "analysed", "actual_visit_date": first_visit}
+
+def test_new_images_keep_an_analysed_visit_analysed(blobs, db):
+    db.assignment.update(status="analysed", actual_visit_date=datetime.datetime(2024, 1, 1))
+    blobs.uploaded.add("7/late.jpg")
+    result = complete_visit_upload(UploadCompleteRequest(assignment_id=7, blob_names=["7/late.jpg"]), None)
+    assert len(result["inserted_images"]) == 1
+    assert db.assignment == {"status": "analysed", "actual_visit_date": datetime.datetime(2024, 1, 1)}